@@ -0,0 +1,101 @@
+import os
+import pickle
+
+
+class ParseCache:
+    """
+    On-disk cache of pickles, keyed by a content hash (the caller picks the key)
+    Once the files add up to more than max_bytes, the least recently used ones are removed
+    (a hit touches the file, so mtime is when it was last used)
+
+    hits, misses: how many lookups found something
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # total size of the files, only counted when something is added
+        self.size = None
+
+    def get(self, key):
+        """
+        return the value, or None if it isn't cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                value = pickle.load(fp)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, or removed/half written by another process
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        # the same key written again (e.g. two workers missed on the same receipt) replaces the file
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        # write then rename, so other processes never read half a file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_path, path)
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self._entries())
+        else:
+            self.size += len(data) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        remove the least recently used files, until there is some room (90% of max_bytes)
+        """
+        entries = sorted(self._entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def counts(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def add_counts(self, counts):
+        """
+        counts from another process (@see counts)
+        """
+        self.hits += counts["hits"]
+        self.misses += counts["misses"]
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def _entries(self):
+        """
+        return list of (mtime, size, path)
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pickle"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
@@ -1,28 +1,101 @@
 import datetime
 import decimal
+import functools
+from email.utils import parsedate_to_datetime
+
+from app.parse.records import Record
+from app.parse.warning import ParseWarning
 
 format_string = "%a, %d %b %Y %H:%M:%S %z"
+WEEKDAYS = {"Mon,", "Tue,", "Wed,", "Thu,", "Fri,", "Sat,", "Sun,"}
+MONTHS = {
+    name: number
+    for number, name in enumerate(
+        "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split(), start=1
+    )
+}
+# emails from the same day/batch often have the same date header
+DATE_MEMO_SIZE = 1024
 
 
 def parse_date_raw(transactions):
     """
     Convert the date strings into python date objects
+    (and seconds since the epoch, to compare without the timezones)
     """
     for trans in transactions:
         if "date_raw" not in trans:
             trans.setdefault("warning", []).append("missing date")
         else:
             try:
-                trans["date"] = datetime.datetime.strptime(
-                    trans["date_raw"], format_string
-                )
+                trans["date"], trans["date_epoch"] = parse_date(trans["date_raw"])
             except ValueError as e:
                 trans.setdefault("warning", []).append(f"Error parsing date: {e}")
 
 
+@functools.lru_cache(maxsize=DATE_MEMO_SIZE)
+def parse_date(date_raw):
+    """
+    date_raw: email date header ("Sat, 26 Apr 2025 15:23:14 +0000")
+    return (datetime, epoch seconds)
+    """
+    date = _parse_date_fixed(date_raw)
+    if date is None:
+        # anything else email allows (no weekday, "GMT", comments, …)
+        date = parsedate_to_datetime(date_raw)
+        if date.tzinfo is None:
+            # "-0000" is UTC, without saying where the sender is
+            date = date.replace(tzinfo=datetime.timezone.utc)
+    return date, int(date.timestamp())
+
+
+def _parse_date_fixed(date_raw):
+    """
+    Same as strptime(format_string), for the layout the dates almost always have
+    return None if it's some other layout
+    """
+    parts = date_raw.split(" ")
+    if len(parts) != 6:
+        return None
+    weekday, day, month, year, time, zone = parts
+    if (
+        weekday not in WEEKDAYS
+        or month not in MONTHS
+        or not (day.isdigit() and len(day) <= 2)
+        or not (year.isdigit() and len(year) == 4)
+        or not (len(time) == 8 and time[2] == ":" and time[5] == ":")
+        or not (len(zone) == 5 and zone[0] in "+-" and zone[1:].isdigit())
+        or zone[3] > "5"
+    ):
+        return None
+    hour, minute, second = time[0:2], time[3:5], time[6:8]
+    if not (hour.isdigit() and minute.isdigit() and second.isdigit()):
+        return None
+    # out of range fields (day 31 in April) raise ValueError, same as strptime
+    return datetime.datetime(
+        int(year),
+        MONTHS[month],
+        int(day),
+        int(hour),
+        int(minute),
+        int(second),
+        tzinfo=_timezone(zone),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(zone):
+    offset = datetime.timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5]))
+    return datetime.timezone(-offset if zone[0] == "-" else offset)
+
+
 def datetime_serializer(obj):
     if isinstance(obj, datetime.datetime):
         return obj.isoformat()  # Converts to ISO string
     if isinstance(obj, decimal.Decimal):
         return str(obj)
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, ParseWarning):
+        return obj.to_dict()
     raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
@@ -1,6 +1,24 @@
+import html
+import re
 from html.parser import HTMLParser
 
 DEBUG = False
+# pull the <pre> blocks straight out of the html, without tokenizing the whole document
+# (falls back to MyHTMLParser when the markup is ambiguous)
+FAST_PATH = True
+# run both, and add a warning when they don't agree
+CHECK_FAST_PATH = False
+
+PRE_BLOCK = re.compile(r"<pre(?=[\s/>])([^>]*)>(.*?)</pre\s*>", re.I | re.S)
+PRE_TAG = re.compile(r"</?pre(?=[\s/>])", re.I)
+# only simple tags (no quoted attributes) inside the <pre>, e.g. <br>
+INNER_TAG = re.compile(r"</?[a-zA-Z][^<>\"']*>")
+# anything where "<pre" might not be a tag, or where the data isn't plain text
+#  - a "<" before the end of a tag, e.g. <p title="<pre>">, or text like x<y<pre>
+AMBIGUOUS = re.compile(
+    r"<!--|<!\[|<\?|<(?:script|style|textarea|title|xmp|plaintext)\b|</?[a-zA-Z][^<>]*<",
+    re.I,
+)
 
 
 def parse_body_html(transactions):
@@ -25,10 +43,17 @@ def _parse_body_html(trans):
     """
     Do the actual work.
     """
-    parser = MyHTMLParser()
-    parser.init()
-    parser.feed(trans.pop("body_html"))
-    receipt_raw = parser.data
+    body_html = trans.pop("body_html")
+    receipt_raw = extract_pre_fast(body_html) if FAST_PATH else None
+    if receipt_raw is None or CHECK_FAST_PATH:
+        parser = MyHTMLParser()
+        parser.init()
+        parser.feed(body_html)
+        if CHECK_FAST_PATH and receipt_raw is not None and receipt_raw != parser.data:
+            trans.setdefault("warning", []).append(
+                "Fast path <pre> extraction does not match HTMLParser"
+            )
+        receipt_raw = parser.data
 
     if len(receipt_raw) < 10:
         trans.setdefault("warning", []).append("Receipt seems kinda short?")
@@ -42,6 +67,32 @@ def _parse_body_html(trans):
     trans["receipt_raw"] = receipt_raw
 
 
+def extract_pre_fast(body_html):
+    """
+    Same as MyHTMLParser().data, but only looks at the <pre> blocks
+
+    return list of the text inside them, or None if it needs a real parser
+    """
+    if AMBIGUOUS.search(body_html):
+        return None
+    blocks = PRE_BLOCK.findall(body_html)
+    # unclosed or nested
+    if len(PRE_TAG.findall(body_html)) != 2 * len(blocks):
+        return None
+
+    data = []
+    for attrs, content in blocks:
+        # <pre/>, or a ">" inside a quoted attribute
+        if attrs.endswith("/") or attrs.count('"') % 2 or attrs.count("'") % 2:
+            return None
+        for segment in INNER_TAG.split(content):
+            if "<" in segment:
+                return None
+            if segment:
+                data.append(html.unescape(segment))
+    return data
+
+
 class MyHTMLParser(HTMLParser):
     # XXX using __init__ will break HTMLParser
     def init(self):
@@ -1,14 +1,47 @@
+import hashlib
+import itertools
+import json
 import mailbox
+import mmap
+import multiprocessing
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from email import policy
-from email.parser import BytesParser
+from email.errors import HeaderParseError
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser, BytesParser
+from email.utils import getaddresses
 
+from app.parse.html import parse_body_html
+from app.parse.receipt import get_parse_cache, parse_receipt_raw, use_parse_cache
+from app.parse.records import Transaction
 
-def parse_eml_file(eml_file_path):
+MBOX_INDEX_SUFFIX = ".idx.json"
+HEADER_END = re.compile(rb"\r?\n\r?\n")
+NEWLINE = re.compile(rb"\r\n?")
+
+# only decode the emails that look like receipts (empty means everything is a receipt)
+# e.g. MAIL_FILTER_SENDERS = ["no-reply@fake.it.com"]
+MAIL_FILTER_SENDERS = []
+# e.g. MAIL_FILTER_SUBJECT = r"e-receipt"
+MAIL_FILTER_SUBJECT = None
+# mailing lists are never receipts, e.g. MAIL_FILTER_LIST_IDS = ["weekly-ad.fake.it.com"]
+MAIL_FILTER_LIST_IDS = []
+
+# transactions are records instead of dicts, to save memory (@see app/parse/records.py)
+RECORDS = False
+# how traverse_files_recursive(jobs=…) starts its workers, None is the platform default
+#  - "spawn"/"forkserver" workers start from a fresh import (module settings are back to their defaults)
+MP_START_METHOD = None
+
+
+def parse_eml_file(eml_file_path, known=(), mail_filter=None):
     """
     Parses an Eml file, converts the email in some kind of data object
 
     eml_file_path: filepath of eml file
+    known, mail_filter: @see get_transaction_from_bytes
     return list of dicts
         id: some arbitrary value to tell them apart, within a given file
         date_raw: date from email
@@ -19,8 +52,13 @@ def parse_eml_file(eml_file_path):
 
     try:
         with open(eml_file_path, "rb") as fp:
-            message = BytesParser(policy=policy.default).parse(fp)
-        transactions.append(get_transaction_from_message(message, eml_file_path, 0))
+            # BytesParser.parse(fp) reads the file with universal newlines, parsebytes doesn't
+            message_bytes = NEWLINE.sub(b"\n", fp.read())
+        trans = get_transaction_from_bytes(
+            message_bytes, eml_file_path, 0, known, mail_filter, policy.default
+        )
+        if trans is not None:
+            transactions.append(trans)
     except FileNotFoundError:
         print(f"Error: Mbox file not found at {eml_file_path}")
     except Exception as e:
@@ -29,37 +67,242 @@ def parse_eml_file(eml_file_path):
     return transactions
 
 
-def parse_mbox_file(mbox_file_path):
+def parse_mbox_file(mbox_file_path, jobs=None, idx=None, mail_filter=None):
     """
     Parses an Mbox file, converts each email in some kind of data object
 
     mbox_file_path: filepath of mbox file
+    jobs (int): split the file into byte ranges, and parse them with a pool of processes
+        the workers also run parse_body_html and parse_receipt_raw for their range
+    idx (int): only parse this one message (@see fetch_mbox_message)
+    mail_filter (MailFilter): skip the emails that aren't receipts
     return list of dicts
         id: some arbitrary value to tell them apart
         date_raw: date from email
         body_html: html content of email
         body_text: text content of email
     """
-    transactions = []
+    if idx is not None:
+        return [fetch_mbox_message(mbox_file_path, idx)]
+    if jobs:
+        tasks = [
+            (mbox_file_path, start, stop, 0)
+            for start, stop in split_mbox_ranges(mbox_file_path, jobs)
+        ]
+        return list(_iter_tasks_parallel(tasks, jobs, mail_filter))
+    return list(iter_mbox_file(mbox_file_path, mail_filter=mail_filter))
+
+
+def iter_mbox_file(
+    mbox_file_path, start=0, stop=None, idx=0, known=(), mail_filter=None
+):
+    """
+    Same as parse_mbox_file, but streams the file one message at a time
+    (so memory doesn't grow with the size of the archive)
 
+    mbox_file_path: filepath of mbox file
+    start, stop: only read this byte range of the file (@see split_mbox_ranges)
+    idx: the idx of the first message in the range
+    known, mail_filter: @see get_transaction_from_bytes
+    yield dicts (@see parse_mbox_file)
+    """
     try:
-        # Open the Mbox file
-        with MboxReader(mbox_file_path) as mbox:
-            # Iterate through each message in the Mbox file
-            for i, message in enumerate(mbox):
-                transactions.append(
-                    get_transaction_from_message(message, mbox_file_path, i)
+        with open(mbox_file_path, "rb") as fp:
+            fp.seek(start)
+            for i, (_, _, message_bytes) in enumerate(
+                iter_mbox_messages(fp, stop), idx
+            ):
+                trans = get_transaction_from_bytes(
+                    message_bytes, mbox_file_path, i, known, mail_filter
                 )
+                if trans is not None:
+                    yield trans
     except FileNotFoundError:
         print(f"Error: Mbox file not found at {mbox_file_path}")
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    return transactions
+
+def iter_mbox_messages(fp, stop=None):
+    """
+    Scan an Mbox file for the "From " separators, yield one message at a time.
+    Uses the same message boundaries as mailbox.mbox, but without building the table of contents first.
+
+    fp: mbox file, opened as binary (starts reading at the current position)
+    stop: byte offset to stop at (must be the start of a "From " line)
+    yield (start, stop, message_bytes)
+        start, stop: byte offsets of the message (start is the "From " line)
+        message_bytes: the message itself (without the "From " line)
+    """
+    pos = fp.tell()
+    start = None
+    lines = []
+    last_was_empty = False
+    for line in fp:
+        if stop is not None and pos >= stop:
+            break
+        if line.startswith(b"From "):
+            if start is not None:
+                yield _mbox_message(start, pos, lines, last_was_empty)
+            start = pos
+            lines = []
+            last_was_empty = False
+        else:
+            if start is not None:
+                lines.append(line)
+            last_was_empty = line == mailbox.linesep
+        pos += len(line)
+    if start is not None:
+        yield _mbox_message(start, pos, lines, last_was_empty)
+
+
+def _mbox_message(start, stop, lines, last_was_empty):
+    # the blank line before the next "From " line isn't part of the message
+    if last_was_empty:
+        stop -= len(lines.pop())
+    message_bytes = b"".join(lines).replace(mailbox.linesep, b"\n")
+    return start, stop, message_bytes
+
+
+def split_mbox_ranges(mbox_file_path, n, start=0):
+    """
+    Split an Mbox file into (at most) n byte ranges of about the same size.
+    Each range starts on a "From " line, so they can be parsed on their own.
+
+    mbox_file_path: filepath of mbox file
+    n: how many ranges to aim for
+    start: only split the end of the file, from this byte offset
+    return list of (start, stop)
+    """
+    with open(mbox_file_path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if start >= size:
+            return []
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = [start]
+            for i in range(1, n):
+                pos = mm.find(
+                    b"\nFrom ", max(bounds[-1], start + (size - start) * i // n)
+                )
+                if pos == -1:
+                    break
+                bounds.append(pos + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def count_mbox_messages(mbox_file_path, start=0, stop=None):
+    """
+    Count the messages in (a byte range of) an Mbox file, without parsing any of them
+
+    start, stop: byte range, start needs to be at the beginning of a line
+    """
+    with open(mbox_file_path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        stop = size if stop is None else stop
+        if start >= stop:
+            return 0
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count = 1 if mm[start : start + 5] == b"From " else 0
+            pos = mm.find(b"\nFrom ", start)
+            while pos != -1 and pos + 1 < stop:
+                count += 1
+                pos = mm.find(b"\nFrom ", pos + 1)
+    return count
+
+
+def get_mbox_index(mbox_file_path):
+    """
+    Sidecar index for an Mbox file, to jump straight to one message.
+    Saved next to the mbox on first use, reused while the size and mtime of the mbox don't change.
+
+    mbox_file_path: filepath of mbox file
+    return dict
+        size, mtime: of the mbox file when it was indexed
+        messages: list of [offset, length, date_raw], by idx
+    """
+    index_file_path = mbox_file_path + MBOX_INDEX_SUFFIX
+    stat = os.stat(mbox_file_path)
+    try:
+        with open(index_file_path, "r") as file:
+            index = json.loads(file.read())
+        if index["size"] == stat.st_size and index["mtime"] == stat.st_mtime_ns:
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    index = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "messages": []}
+    with open(mbox_file_path, "rb") as fp:
+        for start, stop, message_bytes in iter_mbox_messages(fp):
+            date_raw = parse_headers(message_bytes)["date"]
+            index["messages"].append([start, stop - start, date_raw])
+    with open(index_file_path, "w") as file:
+        file.write(json.dumps(index))
+    return index
+
+
+def fetch_mbox_message(mbox_file_path, idx):
+    """
+    Parse one message out of an Mbox file, without reading the ones before it
+
+    mbox_file_path: filepath of mbox file
+    idx: message number in the file (same as trans["idx"])
+    return dict (@see parse_mbox_file)
+    """
+    offset, length, _ = get_mbox_index(mbox_file_path)["messages"][idx]
+    with open(mbox_file_path, "rb") as fp:
+        fp.seek(offset)
+        data = fp.read(length)
+    # skip the "From " line
+    message_bytes = data.partition(b"\n")[2].replace(mailbox.linesep, b"\n")
+    return get_transaction_from_bytes(message_bytes, mbox_file_path, idx)
+
+
+def parse_headers(message_bytes, policy=policy.compat32):
+    """
+    Header-only pass (Date, Message-ID, From, Subject, …)
+    Stops at the first blank line, the body isn't even looked at.
+    """
+    header_end = HEADER_END.search(message_bytes)
+    if header_end:
+        message_bytes = message_bytes[: header_end.end()]
+    return BytesHeaderParser(policy=policy).parsebytes(message_bytes)
+
+
+def get_transaction_from_bytes(
+    message_bytes, filename, idx, known=(), mail_filter=None, policy=policy.compat32
+):
+    """
+    Header-first: the headers decide if the body is worth decoding
+
+    message_bytes: raw email
+    known: date_raw of the transactions we already have (e.g. dedup_transactions)
+        these duplicates only get their headers parsed, they don't have a body
+    mail_filter (MailFilter): skip the emails that aren't receipts
+    policy: email policy (mbox files have always used compat32)
+    return dict (@see get_transaction_from_message), or None if it was filtered out
+    """
+    headers = parse_headers(message_bytes, policy)
+    if mail_filter is not None and not mail_filter(headers):
+        return None
+
+    trans = get_transaction_from_headers(headers, filename, idx)
+    if trans["date_raw"] in known:
+        return trans
+
+    message = BytesParser(policy=policy).parsebytes(message_bytes)
+    _add_body_from_message(trans, message)
+    return trans
 
 
 def get_transaction_from_message(message, filename, idx):
-    trans = {}
+    trans = get_transaction_from_headers(message, filename, idx)
+    _add_body_from_message(trans, message)
+    return trans
+
+
+def get_transaction_from_headers(headers, filename, idx):
+    trans = Transaction() if RECORDS else {}
     trans["filename"] = filename
     trans["idx"] = idx
 
@@ -67,11 +310,15 @@ def get_transaction_from_message(message, filename, idx):
     # data["from"] = message["from"]
     # data["to"] = message["to"]
     # data["subject"] = message["subject"]
-    trans["date_raw"] = message["date"]
+    trans["date_raw"] = headers["date"]
 
     # XXX consider using date instead of idx
     trans["id"] = f"{trans['date_raw']} @ {trans['filename']}"
 
+    return trans
+
+
+def _add_body_from_message(trans, message):
     # Extract and print the email body (plain text part)
     if message.is_multipart():
         for part in message.walk():
@@ -101,7 +348,74 @@ def get_transaction_from_message(message, filename, idx):
         except UnicodeDecodeError:
             trans.setdefault("warning", []).append("Body could not be decoded")
 
-    return trans
+
+class MailFilter:
+    """
+    Header-level filter, to skip the emails that aren't receipts before any of the body is decoded
+    Counts how many emails each rule has skipped.
+
+    senders: allowlist of From addresses
+    subject: regex the Subject needs to match
+    list_ids: List-Id of mailing lists to skip
+    None is MAIL_FILTER_SENDERS/MAIL_FILTER_SUBJECT/MAIL_FILTER_LIST_IDS (as they are now, not on import)
+    """
+
+    def __init__(self, senders=None, subject=None, list_ids=None):
+        if senders is None:
+            senders = MAIL_FILTER_SENDERS
+        if subject is None:
+            subject = MAIL_FILTER_SUBJECT
+        if list_ids is None:
+            list_ids = MAIL_FILTER_LIST_IDS
+        self.senders = {sender.lower() for sender in senders}
+        self.subject = re.compile(subject) if subject else None
+        self.list_ids = [list_id.lower() for list_id in list_ids]
+        self.skipped = {"sender": 0, "subject": 0, "list_id": 0}
+
+    def __call__(self, headers):
+        """
+        return True if the email should be kept
+        """
+        if self.senders:
+            addresses = getaddresses([_header_str(headers, "from")])
+            if not any(address.lower() in self.senders for _, address in addresses):
+                self.skipped["sender"] += 1
+                return False
+        if self.subject and not self.subject.search(_header_str(headers, "subject")):
+            self.skipped["subject"] += 1
+            return False
+        if self.list_ids:
+            list_id = _header_str(headers, "list-id").lower()
+            if any(skip in list_id for skip in self.list_ids):
+                self.skipped["list_id"] += 1
+                return False
+        return True
+
+    def add_skipped(self, skipped):
+        for rule, count in skipped.items():
+            self.skipped[rule] += count
+
+    def report(self):
+        """
+        a line for each rule that skipped something
+        """
+        return "".join(
+            f"skipped {count} emails ({rule})\n"
+            for rule, count in self.skipped.items()
+            if count
+        )
+
+
+def _header_str(headers, name):
+    # compat32 leaves encoded words (=?utf-8?…?=) as they are
+    value = headers.get(name)
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(str(value))))
+    except (LookupError, HeaderParseError, UnicodeError):
+        # unknown charset, or a broken encoded word; match against it as it is
+        return str(value)
 
 
 class MboxReader:
@@ -122,32 +436,322 @@ class MboxReader:
         return False
 
 
-def traverse_files_recursive(directory_path):
+def traverse_files_recursive(
+    directory_path, jobs=None, manifest=None, mail_filter=None, receipt_raw=None
+):
     """
     Recursively parse eml/mbox all files within a given directory and its subdirectories.
 
     De-dup by date (full timestamp), in case exported the same email.
 
     directory_path (str): The path to the directory to start the search from.
+    jobs (int): spread the files across a pool of processes
+        the workers also run parse_body_html and parse_receipt_raw for their files
+    manifest (dict): what previous runs have already parsed, updated in place
+        only new files (and new messages at the end of an mbox) are parsed
+        @see merge_transactions to combine them with the previous run
+    mail_filter (MailFilter): skip the emails that aren't receipts
+    receipt_raw (dict): with jobs, the receipt lines the workers parsed (@see parse_receipt_raw)
     return list of transactions
     """
+    # duplicates are found from the headers, before their body is decoded
     unique_transactions = {}
+    if jobs:
+        transactions = _iter_tasks_parallel(
+            _list_tasks(directory_path, manifest, jobs), jobs, mail_filter, receipt_raw
+        )
+    else:
+        transactions = iter_files_recursive(
+            directory_path, manifest, unique_transactions, mail_filter
+        )
+    transactions = list(dedup_transactions(transactions, unique_transactions))
+    if jobs and receipt_raw is not None:
+        # the workers parsed the duplicates too
+        kept = {trans["id"] for trans in transactions}
+        for trans_id in [trans_id for trans_id in receipt_raw if trans_id not in kept]:
+            del receipt_raw[trans_id]
+    return transactions
+
+
+def iter_files_recursive(directory_path, manifest=None, known=(), mail_filter=None):
+    """
+    Same as traverse_files_recursive, but streams the transactions one at a time (and doesn't de-dup)
+
+    directory_path (str): The path to the directory to start the search from.
+    known, mail_filter: @see get_transaction_from_bytes
+    yield transactions
+    """
+    for full_path, start, stop, idx in _list_tasks(directory_path, manifest):
+        yield from iter_mail_file(full_path, start, stop, idx, known, mail_filter)
+
+
+def _list_tasks(directory_path, manifest=None, jobs=None):
+    """
+    Walk the directory, and figure out what needs to be parsed
+    return list of (full_path, start, stop, idx)
+    """
+    tasks = []
+    seen = set()
     for root, _, files in os.walk(directory_path):
         for file in files:
             full_path = os.path.join(root, file)
-            ts = []
-            if file.lower().endswith(".eml"):
-                ts.extend(parse_eml_file(full_path))
-            elif file.lower().endswith(".mbox"):
-                ts.extend(parse_mbox_file(full_path))
-            for trans in ts:
-                date_raw = trans["date_raw"]
-                if date_raw in unique_transactions:
-                    uniq = unique_transactions[date_raw]
-                    print(
-                        f"Duplicate email at {date_raw}\n  {trans['id']}\n  {uniq['id']}"
+            if not file.lower().endswith((".eml", ".mbox")):
+                continue
+            seen.add(full_path)
+            start, idx = 0, 0
+            if manifest is not None:
+                todo = _check_manifest(full_path, manifest)
+                if todo is None:
+                    continue
+                start, idx = todo
+            if jobs and file.lower().endswith(".mbox"):
+                # one big mbox should still use all of the workers
+                tasks.extend(
+                    (full_path, range_start, range_stop, idx)
+                    for range_start, range_stop in split_mbox_ranges(
+                        full_path, jobs, start
                     )
-                    uniq.setdefault("duplicates", [uniq["id"]]).append(trans["id"])
-                else:
-                    unique_transactions[date_raw] = trans
-    return list(unique_transactions.values())
+                )
+            else:
+                tasks.append((full_path, start, None, idx))
+    if manifest is not None:
+        for full_path in [full_path for full_path in manifest if full_path not in seen]:
+            # the file is gone
+            del manifest[full_path]
+    return tasks
+
+
+def _check_manifest(full_path, manifest):
+    """
+    Compare a file with its manifest entry, and update the entry for this run
+        size, mtime: to skip unchanged files without reading them
+        sha256: content hash, up to offset
+        offset: how much of the file has been parsed
+        count: how many messages are in the file, up to offset (filtered or not)
+        start_idx: messages before this were parsed by a previous run (@see merge_transactions)
+    return (start, idx) where to start parsing, or None if there is nothing new
+    """
+    stat = os.stat(full_path)
+    entry = manifest.get(full_path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+        entry["start_idx"] = entry["count"]
+        return None
+
+    start, idx = 0, 0
+    sha256 = hashlib.sha256()
+    with open(full_path, "rb") as fp:
+        if entry and entry["offset"] <= stat.st_size:
+            _hash_file(sha256, fp, entry["offset"])
+            if sha256.hexdigest() == entry["sha256"]:
+                # same content as last time, up to where we stopped
+                start, idx = entry["offset"], entry["count"]
+        _hash_file(sha256, fp, stat.st_size - fp.tell())
+    if full_path.lower().endswith(".mbox"):
+        count = idx + count_mbox_messages(full_path, start)
+    else:
+        count = 1
+    manifest[full_path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": sha256.hexdigest(),
+        "offset": stat.st_size,
+        "count": count,
+        "start_idx": idx,
+    }
+
+    if start == stat.st_size:
+        # only touched
+        return None
+    if start and not full_path.lower().endswith(".mbox"):
+        # only mbox files can be appended to, anything else starts over
+        manifest[full_path]["start_idx"] = 0
+        return 0, 0
+    return start, idx
+
+
+def _hash_file(sha256, fp, length, block_size=1 << 20):
+    while length > 0:
+        block = fp.read(min(block_size, length))
+        if not block:
+            break
+        sha256.update(block)
+        length -= len(block)
+
+
+def merge_transactions(previous, transactions, manifest):
+    """
+    Combine the transactions from a previous run with the new ones from traverse_files_recursive(manifest=…)
+    Previous transactions are dropped if their file is gone, or if it was parsed again from the start.
+
+    previous: transactions from the previous run
+    transactions: new transactions from this run
+    manifest: the manifest that was just updated by traverse_files_recursive
+    return list of transactions (de-duped)
+    """
+    kept = [
+        trans
+        for trans in previous
+        if trans["filename"] in manifest
+        and trans["idx"] < manifest[trans["filename"]]["start_idx"]
+    ]
+    return list(dedup_transactions(itertools.chain(kept, transactions)))
+
+
+def merge_receipt_raw(previous, receipt_raw, transactions):
+    """
+    Combine the receipt lines from a previous run with the new ones, same as merge_transactions
+
+    previous: receipt lines from the previous run
+        (older runs saved a list of transactions, those still have their receipt_raw)
+    receipt_raw: new receipt lines from this run (@see parse_receipt_raw)
+    transactions: the merged transactions, only their lines are kept
+    return dict of trans id -> receipt lines
+    """
+    if isinstance(previous, list):
+        previous = {
+            trans["id"]: trans["receipt_raw"]
+            for trans in previous
+            if "receipt_raw" in trans
+        }
+    merged = {}
+    for trans in transactions:
+        trans_id = trans["id"]
+        if trans_id in receipt_raw:
+            merged[trans_id] = receipt_raw[trans_id]
+        elif trans_id in previous:
+            merged[trans_id] = previous[trans_id]
+    return merged
+
+
+def _iter_tasks_parallel(tasks, jobs, mail_filter=None, receipt_raw=None):
+    """
+    tasks: list of (full_path, start, stop, idx), mbox ranges need to be in order
+    mail_filter: each worker gets a copy, their skip counts are added back in
+    receipt_raw (dict): filled in with the receipt lines the workers parsed (@see parse_receipt_raw)
+    yield transactions, in the same order (and with the same idx) as parsing the files one after another
+    """
+    # lots of small eml files, send them over in batches
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    next_idx = {}
+    parse_cache = get_parse_cache()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context(MP_START_METHOD),
+        initializer=_init_worker,
+        initargs=(parse_cache.directory, parse_cache.max_bytes)
+        if parse_cache is not None
+        else (None, None),
+    ) as executor:
+        # map returns the results in the order of tasks, not the order the workers finish
+        results = executor.map(
+            _parse_mail_file_worker,
+            tasks,
+            itertools.repeat(mail_filter),
+            chunksize=chunksize,
+        )
+        for (full_path, _, _, idx), (
+            transactions,
+            count,
+            skipped,
+            cache_counts,
+            task_receipt_raw,
+        ) in zip(tasks, results):
+            # each range started counting at idx, shift it to after the previous ranges
+            base_idx = next_idx.get(full_path, idx) - idx
+            for trans in transactions:
+                trans["idx"] += base_idx
+                yield trans
+            next_idx[full_path] = base_idx + idx + count
+            if mail_filter is not None:
+                mail_filter.add_skipped(skipped)
+            if parse_cache is not None:
+                parse_cache.add_counts(cache_counts)
+            if receipt_raw is not None:
+                receipt_raw.update(task_receipt_raw)
+
+
+def _init_worker(cache_directory, cache_max_bytes):
+    # the workers don't always start as a copy of this process (@see MP_START_METHOD)
+    use_parse_cache(cache_directory, cache_max_bytes)
+
+
+def _parse_mail_file_worker(task, mail_filter=None):
+    """
+    Everything that can happen on one file (or mbox range) without looking at the others
+    return (
+        transactions,
+        how many messages were in the range,
+        skip counts of the mail_filter,
+        hit/miss counts of the parse cache,
+        trans id -> receipt lines (before parse_receipt_raw took them off the transactions),
+    )
+    """
+    full_path, start, stop, _ = task
+    if mail_filter is not None:
+        # the copy we got may have been pickled after the parent already added some counts
+        # (and tasks in the same chunk share a copy), only send back what this task skipped
+        mail_filter.skipped = dict.fromkeys(mail_filter.skipped, 0)
+    # de-dup within the task, so the duplicates don't get decoded
+    # (the parent de-dups across tasks)
+    known = set()
+    transactions = []
+    for trans in iter_mail_file(*task, known, mail_filter):
+        known.add(trans["date_raw"])
+        transactions.append(trans)
+    parse_body_html(transactions)
+    # the worker keeps its cache between tasks, only send back the counts for this one
+    parse_cache = get_parse_cache()
+    cache_counts = parse_cache.counts() if parse_cache else None
+    receipt_raw = {}
+    parse_receipt_raw(transactions, receipt_raw)
+    if parse_cache is not None:
+        cache_counts = {
+            key: count - cache_counts[key]
+            for key, count in parse_cache.counts().items()
+        }
+
+    count = 1
+    if full_path.lower().endswith(".mbox"):
+        count = count_mbox_messages(full_path, start, stop)
+    return (
+        transactions,
+        count,
+        dict(mail_filter.skipped) if mail_filter else None,
+        cache_counts,
+        receipt_raw,
+    )
+
+
+def iter_mail_file(full_path, start=0, stop=None, idx=0, known=(), mail_filter=None):
+    """
+    Pick the parser based on the file extension (anything else is ignored)
+
+    start, stop, idx: byte range and idx of its first message, only for mbox files
+    known, mail_filter: @see get_transaction_from_bytes
+    """
+    if full_path.lower().endswith(".eml"):
+        yield from parse_eml_file(full_path, known, mail_filter)
+    elif full_path.lower().endswith(".mbox"):
+        yield from iter_mbox_file(full_path, start, stop, idx, known, mail_filter)
+
+
+def dedup_transactions(transactions, unique_transactions=None):
+    """
+    De-dup by date (full timestamp), in case exported the same email.
+    The first one wins, the ids of the others are kept in its "duplicates".
+
+    transactions: any iterable of transactions (e.g. iter_files_recursive)
+    unique_transactions (dict): date_raw -> trans, filled in as they are found
+    yield the unique transactions, as soon as they are found
+    """
+    if unique_transactions is None:
+        unique_transactions = {}
+    for trans in transactions:
+        date_raw = trans["date_raw"]
+        if date_raw in unique_transactions:
+            uniq = unique_transactions[date_raw]
+            print(f"Duplicate email at {date_raw}\n  {trans['id']}\n  {uniq['id']}")
+            uniq.setdefault("duplicates", [uniq["id"]]).append(trans["id"])
+        else:
+            unique_transactions[date_raw] = trans
+            yield trans
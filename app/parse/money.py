@@ -0,0 +1,41 @@
+from decimal import Decimal
+
+# money as int cents, so the parser and stats can add plain ints
+# Decimal is only for the edges (saving/loading json, printing)
+
+
+def to_cents(amount):
+    """
+    amount: receipt string ("12.34", "0"), or Decimal
+    return int cents
+    """
+    if isinstance(amount, Decimal):
+        return int(amount.scaleb(2))
+    whole, _, fraction = amount.partition(".")
+    if len(fraction) > 2:
+        raise ValueError(f"more than two decimal places: {amount}")
+    return int(whole + fraction.ljust(2, "0"))
+
+
+def cents_to_decimal(cents):
+    """
+    int cents back to a Decimal with two places (1234 -> Decimal("12.34"))
+    """
+    return Decimal(cents).scaleb(-2)
+
+
+def format_money(amount):
+    """
+    str for either representation (for warnings, graphs)
+    """
+    if isinstance(amount, int):
+        amount = cents_to_decimal(amount)
+    return str(amount)
+
+
+def round_up_div(numerator, denominator):
+    """
+    integer division, rounded away from zero (same as ROUND_UP)
+    """
+    quotient = -(-abs(numerator) // denominator)
+    return quotient if numerator >= 0 else -quotient
@@ -1,7 +1,16 @@
+import functools
+import hashlib
+import json
+import os
 import re
 from decimal import ROUND_UP, Decimal
 from typing import List
 
+from app.parse.cache import ParseCache
+from app.parse.money import cents_to_decimal, format_money, round_up_div, to_cents
+from app.parse.records import Adjustment, Item, Transaction
+from app.parse.warning import ParseWarning
+
 # XXX should categories be automatic?
 CATEGORIES = [
     "Age Restricted: 18",
@@ -44,7 +53,270 @@ CREDIT_LINE = re.compile(r"^(SC)\s{6}(.{20})\s*(\d+\.\d\d)( F|-F)")
 WEIGHT_LINE = re.compile(r"^ (\d*\.\d+ lb @ \d+\.\d\d /lb)( = (\d+\.\d\d))?\s+$")
 QUANTITY_LINE = re.compile(r"^ (\d+ @ \d+\.\d\d)\s+$")
 
+STORE_LINE = r"Store #(\d+)"
+STARS_LINE = r"\*+\Z"
+TAX_LINE = r"\s+TAX\s+(\d+\.\d\d)  $"
+BALANCE_LINE = r"\s+\**\s+BALANCE\s+(\d+\.\d\d)  $"
+SAVINGS_LINE = r"\s+((BONUS BUY )?SAVINGS)\s+(\d+\.\d\d)" + TAX_CODE_GROUP + r"$"
+VERIFY_LINE = r"\s+(PRICE YOU PAY)\s+(\d+\.\d\d|FREE)\s+"
+VERIFY_FOR_LINE = r"\s+(PRICE YOU PAY FOR)\s+(\d)\s+(\d+\.\d\d)\s+"
+# HACK special case $3 off coupon (@see ReceiptParser._feed_line)
+COUPON_LINE = "SC      $3 OFF WYB3             3.00-T"
+QUANTITY_BREAKDOWN = re.compile(r"^(\d+) @ (\d+\.\d\d)")
+
 SKIP_TAX_CHECK = False
+# money is int cents instead of Decimal (@see app/parse/money.py)
+#  - receipt_data_serializer turns it back into Decimal before saving
+CENTS = False
+# what goes in item["lines"] (where each item came from on the receipt)
+#  - "keep": a copy of the receipt lines
+#  - "offsets": line numbers into receipt_raw (@see resolve_lines)
+#    the lines are kept by trans id (@see parse_receipt_raw, receipt_raw.json)
+#  - "drop": no lines at all (unless DEBUG_LINES)
+LINES = "keep"
+DEBUG_LINES = False
+# parsed receipts are cached on disk (@see use_parse_cache), this is how big it can get
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# how many different lines parse_line remembers (the same items show up on receipt after receipt)
+LINE_MEMO_SIZE = 4096
+# how ReceiptParser.feed splits up the receipt, both give the same receipt_data
+#  - "lines": parse_line on each line
+#  - "scan": one multiline regex over the whole receipt (@see scan_receipt)
+ENGINE = "lines"
+
+
+def _combine_patterns(patterns):
+    """
+    Join [(kind, pattern)] into one alternation, tried in order (same as matching them one after another)
+
+    return (compiled, {kind: slice of match.groups() for that pattern})
+    """
+    parts = []
+    group_slices = {}
+    index = 1
+    for kind, pattern in patterns:
+        group_count = re.compile(pattern).groups
+        parts.append(f"(?P<{kind}>{pattern})")
+        group_slices[kind] = slice(index, index + group_count)
+        index += group_count + 1
+    return re.compile("|".join(parts)), group_slices
+
+
+# which patterns can match depends on how the line starts (the first few columns are fixed)
+# each prefix gets one combined pattern, and a kind for when nothing matches
+# - "text" is in the category column, "other" is in the item columns
+INDENTED_LINE = _combine_patterns(
+    [
+        ("tax", TAX_LINE),
+        ("balance", BALANCE_LINE),
+        ("savings", SAVINGS_LINE),
+        ("item", ITEMIZED_LINE.pattern),
+        ("verify", VERIFY_LINE),
+        ("verify_for", VERIFY_FOR_LINE),
+        ("weight", WEIGHT_LINE.pattern),
+        ("quantity", QUANTITY_LINE.pattern),
+    ]
+)
+WHITESPACE_LINE = _combine_patterns([("tax", TAX_LINE), ("balance", BALANCE_LINE)])
+TEXT_LINE = _combine_patterns(
+    [
+        ("stars", STARS_LINE),
+        ("store", STORE_LINE),
+        ("category", CATEGORY_LINE.pattern),
+    ]
+)
+LINE_PREFIXES = {
+    "WT ": (_combine_patterns([("item", ITEMIZED_LINE.pattern)]), "other"),
+    "MR ": (_combine_patterns([("item", ITEMIZED_LINE.pattern)]), "other"),
+    "SC ": (_combine_patterns([("credit", CREDIT_LINE.pattern)]), "other"),
+}
+
+
+def classify_line(line):
+    """
+    Figure out what kind of receipt line this is, with a single match
+
+    return (kind, groups), groups are the same as the match for that kind of line
+    """
+    if line.isspace():
+        return "blank", ()
+    if line.startswith(" "):
+        (pattern, group_slices), default = INDENTED_LINE, "other"
+    elif line[:1].isspace():
+        (pattern, group_slices), default = WHITESPACE_LINE, "text"
+    elif line[:3] in LINE_PREFIXES:
+        if line == COUPON_LINE:
+            return "coupon", ()
+        (pattern, group_slices), default = LINE_PREFIXES[line[:3]]
+    else:
+        (pattern, group_slices), default = TEXT_LINE, "text"
+
+    match = pattern.match(line)
+    if not match:
+        return default, ()
+    kind = match.lastgroup
+    return kind, match.groups()[group_slices[kind]]
+
+
+@functools.lru_cache(maxsize=LINE_MEMO_SIZE)
+def parse_line(line, cents=False):
+    """
+    classify_line, and the amount on the line converted to money
+    (lines repeat a lot, so this is memoized)
+
+    cents: @see CENTS
+    return (kind, groups, amount), amount is None if the line doesn't have one
+    """
+    kind, groups = classify_line(line)
+    return kind, groups, _line_amount(kind, groups, to_cents if cents else Decimal)
+
+
+def _line_amount(kind, groups, money):
+    amount = None
+    if kind in ("tax", "balance"):
+        amount = money(groups[0])
+    elif kind in ("savings", "item", "credit", "verify_for"):
+        amount = money(groups[2])
+    elif kind == "verify":
+        amount = money("0" if groups[1] == "FREE" else groups[1])
+    elif kind == "weight" and groups[2]:
+        amount = money(groups[2])
+    elif kind == "quantity":
+        match_breakdown = QUANTITY_BREAKDOWN.match(groups[0])
+        if match_breakdown:
+            [count, cost] = match_breakdown.groups()
+            amount = int(count) * money(cost)
+    return amount
+
+
+def _scan_pattern(pattern):
+    """
+    pattern for one line, rewritten so it can't run into the next one (for RECEIPT_SCAN)
+    """
+    return pattern.replace(r"\s", r"[^\S\n]").replace(r"\Z", "$")
+
+
+def _combine_scan_branches(branches):
+    """
+    Same as _combine_patterns, but for the whole receipt at once
+    each branch is (guard, [(kind, pattern)], default), same as one case in classify_line
+     - guard: lookahead for the start of the line
+     - default: kind when none of the patterns match (None if it has to match)
+    every match is exactly one line, and lastgroup is (kind + "_" + branch number)
+
+    return (compiled, {lastgroup: (kind, slice of match.groups())})
+    """
+    parts = []
+    group_kinds = {}
+    index = 1
+    for number, (guard, patterns, default) in enumerate(branches):
+        if default is not None:
+            patterns = patterns + [(default, "")]
+        alternatives = []
+        for kind, pattern in patterns:
+            pattern = _scan_pattern(pattern)
+            group_count = re.compile(pattern).groups
+            name = f"{kind}_{number}"
+            alternatives.append(f"(?P<{name}>{pattern})")
+            group_kinds[name] = (kind, slice(index, index + group_count))
+            index += group_count + 1
+        parts.append(guard + "(?:" + "|".join(alternatives) + ")")
+    pattern = r"^(?:" + "|".join(parts) + r")[^\n]*"
+    return re.compile(pattern, re.MULTILINE), group_kinds
+
+
+# the cases in classify_line, in the same order
+# (blank goes first in the branches that start with whitespace, same as the line.isspace() check)
+RECEIPT_SCAN = _combine_scan_branches(
+    [
+        (
+            "(?= )",
+            [
+                ("blank", r"\s+$"),
+                ("tax", TAX_LINE),
+                ("balance", BALANCE_LINE),
+                ("savings", SAVINGS_LINE),
+                ("item", ITEMIZED_LINE.pattern),
+                ("verify", VERIFY_LINE),
+                ("verify_for", VERIFY_FOR_LINE),
+                ("weight", WEIGHT_LINE.pattern),
+                ("quantity", QUANTITY_LINE.pattern),
+            ],
+            "other",
+        ),
+        (
+            "(?=[^\\S\\n])",
+            [("blank", r"\s+$"), ("tax", TAX_LINE), ("balance", BALANCE_LINE)],
+            "text",
+        ),
+        ("", [("coupon", re.escape(COUPON_LINE) + "$")], None),
+        ("(?=WT |MR )", [("item", ITEMIZED_LINE.pattern)], "other"),
+        ("(?=SC )", [("credit", CREDIT_LINE.pattern)], "other"),
+        (
+            "",
+            [
+                ("stars", STARS_LINE),
+                ("store", STORE_LINE),
+                ("category", CATEGORY_LINE.pattern),
+            ],
+            "text",
+        ),
+    ]
+)
+
+
+def scan_receipt(receipt_raw, cents=False):
+    """
+    classify every line of the receipt with one regex scan, instead of one match per line
+    (the same thing as parse_line, for each line)
+
+    cents: @see CENTS
+    return list of (line, kind, groups, amount), or None if the receipt can't be scanned
+    """
+    if not receipt_raw:
+        return []
+    if any("\n" in line for line in receipt_raw):
+        # XXX lines are split on newlines, so there shouldn't be any
+        return None
+    pattern, group_kinds = RECEIPT_SCAN
+    money = to_cents if cents else Decimal
+    tokens = []
+    for match in pattern.finditer("\n".join(receipt_raw)):
+        kind, group_slice = group_kinds[match.lastgroup]
+        groups = match.groups()[group_slice]
+        tokens.append((match.group(), kind, groups, _line_amount(kind, groups, money)))
+    if len(tokens) != len(receipt_raw):
+        return None
+    return tokens
+
+
+# ParseWarning templates, by code (the text is only made when the warning is printed/saved)
+WARNINGS = {
+    # _parse_receipt_raw
+    "missing_store_number": "Missing store number (never started parsing)",
+    "unfinished_groceries": "Never finished parsing groceries",
+    "skipped_lines": "Some of the receipt lines have not been accouned for (skipped)",
+    "skipped_checks": "skipping checks for totals, receipt nut fully parsed (skipped)",
+    "tax_without_taxable": "tax but no taxable items?",
+    "tax_mismatch": "what is this tax amount? (tax) {tax} != (sum) {sum} * (rate) {rate} == (calc) {calc}",
+    "balance_mismatch": "balance mismatch? (listed) {balance} != (sum) {sum}",
+    "no_balance": "receipt has no balance",
+    # ReceiptParser
+    "duplicate_tax": "duplicate tax? old: {old}, new: {new}",
+    "duplicate_balance": "duplicate balance? old: {old}, new: {new}",
+    "missing_category": "receipt should have a category by this point -- {line}",
+    "invalid_price": "invalid price? {line} -- {item}",
+    "skipping_rest": "skipping rest -- {line}",
+    "no_current_item": "not currently parsing anything",
+    "invalid_match": "invalid match argument",
+    "mismatch_taxable": "mismatch taxable: {match} -- {item}",
+    "weight_verify_mismatch": "verify price ({name}) does not match weight cost: {weight_readout}, {cost} -- {item}",
+    "weight_item_mismatch": "item price ({name}) does not match weight cost: {weight_readout}, {cost} -- {item}",
+    "weight_missing_cost": "should be verifying price, but has none? {weight_readout}, {cost} -- {item}",
+    "weight_cost_on_item": "verify weight price on original item? {weight_readout}, {cost} -- {item}",
+    "quantity_breakdown": "could not break down quantity_readout {quantity_readout} -- {item}",
+    "quantity_mismatch": "quantity_readout does not match actual amount? {quantity_readout} {adjustment} -- {item}",
+}
 
 
 # XXX never ever ever hard code the tax rate, set it as an env var or something
@@ -52,68 +324,238 @@ def APPLY_TAX_RATE(amount):
     return (amount * Decimal("0.06")).quantize(Decimal("0.01"), rounding=ROUND_UP)
 
 
-def parse_receipt_raw(transactions):
+def APPLY_TAX_RATE_CENTS(cents):
+    # same as APPLY_TAX_RATE, in int cents
+    return round_up_div(cents * 6, 100)
+
+
+def parse_receipt_raw(transactions, receipt_raw=None):
     """
     Parse the receipt paper / printout, turn it into a structured list of items
+
+    receipt_raw (dict): trans id -> receipt lines, filled in as they are parsed
+        (parsing takes them off the transaction, this is how to keep them, e.g. for receipt_raw.json)
     """
     for trans in transactions:
         if "receipt_raw" in trans:
+            if receipt_raw is not None:
+                receipt_raw[trans["id"]] = trans["receipt_raw"]
             _parse_receipt_raw(trans)
 
 
 def _parse_receipt_raw(trans):
-    parser = ReceiptParser()
-    parser.feed(trans.pop("receipt_raw"))
+    options = {
+        "cents": CENTS,
+        "records": isinstance(trans, Transaction),
+        "lines": "keep" if DEBUG_LINES else LINES,
+    }
+    receipt_raw = trans.pop("receipt_raw")
+
+    # the same receipt, parsed with the same code and options, comes out the same
+    cached = None
+    if _parse_cache is not None:
+        key = _parse_cache_key(receipt_raw, options)
+        cached = _parse_cache.get(key)
+    if cached is None:
+        receipt_data, warnings = _parse_receipt_lines(receipt_raw, **options)
+        if _parse_cache is not None:
+            _parse_cache.put(key, (receipt_data, warnings))
+    else:
+        receipt_data, warnings = cached
+
+    if warnings:
+        for warning in warnings:
+            warning.trans_id = trans.get("id")
+        trans.setdefault("warning", []).extend(warnings)
+    trans["receipt_data"] = receipt_data
+
+
+def _parse_receipt_lines(receipt_raw, **options):
+    """
+    Everything _parse_receipt_raw does that only depends on the receipt lines
+
+    options: @see ReceiptParser
+    return (receipt_data, warnings)
+    """
+    parser = ReceiptParser(engine=ENGINE, **options)
+    parser.feed(receipt_raw)
     receipt_data = parser.data
+    warnings = parser.warning
 
-    if parser.warning:
-        trans.setdefault("warning", []).extend(parser.warning)
     if "store_number" not in receipt_data:
-        trans.setdefault("warning", []).append(
-            "Missing store number (never started parsing)"
-        )
+        _warn(warnings, "missing_store_number")
     if parser.parsing_groceries:
-        trans.setdefault("warning", []).append("Never finished parsing groceries")
+        _warn(warnings, "unfinished_groceries")
     if receipt_data.get("skipped"):
-        trans.setdefault("warning", []).append(
-            "Some of the receipt lines have not been accouned for (skipped)"
-        )
+        _warn(warnings, "skipped_lines")
 
     if parser.skip_rest:
-        trans.setdefault("warning", []).append(
-            "skipping checks for totals, receipt nut fully parsed (skipped)"
-        )
+        _warn(warnings, "skipped_checks")
     else:
-        if "tax" in receipt_data and receipt_data["tax"] > Decimal("0"):
-            sum = Decimal(0)
+        zero = 0 if parser.cents else Decimal(0)
+        apply_tax_rate = APPLY_TAX_RATE_CENTS if parser.cents else APPLY_TAX_RATE
+        if "tax" in receipt_data and receipt_data["tax"] > zero:
+            sum = zero
             for item in receipt_data["items"]:
                 if item.get("taxable", False):
                     sum += item["price"]
-            if not sum or sum == Decimal(0):
-                trans.setdefault("warning", []).append("tax but no taxable items?")
-            if not SKIP_TAX_CHECK and receipt_data["tax"] != APPLY_TAX_RATE(sum):
-                trans.setdefault("warning", []).append(
-                    f"what is this tax amount? (tax) {receipt_data['tax']} != (sum) {sum} * (rate) {Decimal('0.06')} == (calc) {APPLY_TAX_RATE(sum)}"
+            if not sum or sum == zero:
+                _warn(warnings, "tax_without_taxable")
+            if not SKIP_TAX_CHECK and receipt_data["tax"] != apply_tax_rate(sum):
+                _warn(
+                    warnings,
+                    "tax_mismatch",
+                    tax=format_money(receipt_data["tax"]),
+                    sum=format_money(sum),
+                    rate=Decimal("0.06"),
+                    calc=format_money(apply_tax_rate(sum)),
                 )
 
         if "balance" in receipt_data:
-            sum = Decimal(0)
+            sum = zero
             for item in receipt_data["items"]:
                 sum += item["price"]
             if "tax" in receipt_data:
                 sum += receipt_data["tax"]
             if sum != receipt_data["balance"]:
-                trans.setdefault("warning", []).append(
-                    f"balance mismatch? (listed) {receipt_data['balance']} != (sum) {sum}"
+                _warn(
+                    warnings,
+                    "balance_mismatch",
+                    balance=format_money(receipt_data["balance"]),
+                    sum=format_money(sum),
                 )
         else:
-            trans.setdefault("warning", []).append("receipt has no balance")
+            _warn(warnings, "no_balance")
+
+    return receipt_data, warnings
 
-    trans["receipt_data"] = receipt_data
+
+def _warn(warnings, code, **args):
+    warnings.append(ParseWarning(code, WARNINGS[code], **args))
+
+
+_parse_cache = None
+
+
+def use_parse_cache(directory, max_bytes=PARSE_CACHE_MAX_BYTES):
+    """
+    Cache parsed receipts in directory (or None to stop using it)
+    traverse_files_recursive(jobs=…) hands it to its workers when they start
+
+    return ParseCache, for the hit/miss counts
+    """
+    global _parse_cache
+    _parse_cache = ParseCache(directory, max_bytes) if directory else None
+    return _parse_cache
+
+
+def get_parse_cache():
+    return _parse_cache
+
+
+def _parse_cache_key(receipt_raw, options):
+    data = json.dumps([receipt_raw, options, SKIP_TAX_CHECK]).encode()
+    return hashlib.sha256(parser_fingerprint().encode() + data).hexdigest()
+
+
+@functools.cache
+def parser_fingerprint():
+    """
+    Hash of the parser code (including CATEGORIES etc), so changing it doesn't use stale results
+    """
+    sha256 = hashlib.sha256()
+    directory = os.path.dirname(__file__)
+    for name in ["receipt.py", "money.py", "records.py", "warning.py"]:
+        with open(os.path.join(directory, name), "rb") as fp:
+            sha256.update(fp.read())
+    return sha256.hexdigest()
+
+
+def receipt_data_deserializer(receipt_data, cents=False):
+    """
+    Undo datetime_serializer, for receipt_data loaded back from receipt_parsed.json
+
+    cents: load the money as int cents (@see CENTS)
+    """
+    money = to_cents if cents else Decimal
+    for key in ["tax", "balance"]:
+        if key in receipt_data:
+            receipt_data[key] = money(receipt_data[key])
+    for item in receipt_data["items"]:
+        item["price"] = money(item["price"])
+        for adjustment in item["adjustments"]:
+            for key in ["amount", "price", "weight_price"]:
+                if key in adjustment:
+                    adjustment[key] = money(adjustment[key])
+    return receipt_data
+
+
+def receipt_data_serializer(receipt_data):
+    """
+    Copy of receipt_data with the int cents turned back into Decimal, to save with datetime_serializer
+    (json would write cents as plain numbers, and there'd be no telling them apart when loading)
+    """
+    serialized = {**receipt_data, "items": []}
+    for key in ["tax", "balance"]:
+        if key in serialized:
+            serialized[key] = _money_to_decimal(serialized[key])
+    for item in receipt_data["items"]:
+        serialized["items"].append(
+            {
+                **item,
+                "price": _money_to_decimal(item["price"]),
+                "adjustments": [
+                    _adjustment_to_decimal(adjustment)
+                    for adjustment in item["adjustments"]
+                ],
+            }
+        )
+    return serialized
+
+
+def resolve_lines(item, receipt_raw):
+    """
+    item["lines"], as text
+
+    receipt_raw: the lines of the receipt the item came from (for LINES = "offsets")
+        i.e. receipt_raw[trans["id"]], from parse_receipt_raw (or receipt_raw.json)
+    """
+    return [
+        receipt_raw[line] if isinstance(line, int) else line
+        for line in item.get("lines", [])
+    ]
+
+
+def _money_to_decimal(amount):
+    return cents_to_decimal(amount) if isinstance(amount, int) else amount
+
+
+def _adjustment_to_decimal(adjustment):
+    adjustment = dict(adjustment)
+    for key in ["amount", "price", "weight_price"]:
+        if key in adjustment:
+            adjustment[key] = _money_to_decimal(adjustment[key])
+    return adjustment
+
+
+def _plain_dict(data):
+    return data
 
 
 class ReceiptParser:
-    def __init__(self):
+    def __init__(self, cents=False, records=False, lines="keep", engine="lines"):
+        """
+        cents: money is int cents instead of Decimal (@see CENTS)
+        records: items and adjustments are records instead of dicts (@see app/parse/records.py)
+        lines: "keep", "offsets" or "drop" (@see LINES)
+        engine: "lines" or "scan" (@see ENGINE)
+        """
+        self.cents = cents
+        self.lines = lines
+        self.engine = engine
+        self.money = to_cents if cents else Decimal
+        self.item = Item.from_dict if records else _plain_dict
+        self.adjustment = Adjustment.from_dict if records else _plain_dict
         self.data = {"items": []}
 
     def feed(self, receipt_raw: List[str]):
@@ -125,219 +567,226 @@ class ReceiptParser:
         self.current_weight = None
         self.current_quantity = None
 
-        for line in receipt_raw:
-            if line.isspace():
-                # skip lines that are all spaces
-                continue
-
-            if "store_number" not in self.data:
-                # throw out all the lines before the store number
-                # (the next line starts the produce)
-                # TODO parse date on reciept (store day time, day time 111 222 33 000000)
-                x = re.match("^Store #(\d+)", line)
-                if x:
-                    self.data["store_number"] = int(x.group(1))
-                    self.parsing_groceries = True
-                continue
-
-            if set(line) == {"*"}:
-                # if line all stars, then we are done
-                self.current_item = None
-                self.current_category = None
-                self.parsing_groceries = False
+        tokens = None
+        if self.engine == "scan":
+            tokens = scan_receipt(receipt_raw, self.cents)
+        if tokens is None:
+            tokens = ((line, *parse_line(line, self.cents)) for line in receipt_raw)
 
-            match_tax = re.match(r"^\s+TAX\s+(\d+\.\d\d)  $", line)
-            if match_tax:
-                self.current_item = None
-                self.current_category = None
-                self.parsing_groceries = False
-                [tax] = match_tax.groups()
-                if "tax" in self.data:
-                    self.warning.append(
-                        f"duplicate tax? old: {self.data['tax']}, new: {tax}"
-                    )
-                self.data["tax"] = Decimal(tax)
-                continue
+        for line_number, token in enumerate(tokens):
+            self.line_number = line_number
+            self._feed_line(*token)
 
-            match_balance = re.match(r"^\s+\**\s+BALANCE\s+(\d+\.\d\d)  $", line)
-            if match_balance:
-                self.current_item = None
-                self.current_category = None
-                self.parsing_groceries = False
-                [balance] = match_balance.groups()
-                if "balance" in self.data:
-                    self.warning.append(
-                        f"duplicate balance? old: {self.data['balance']}, new: {balance}"
-                    )
-                self.data["balance"] = Decimal(balance)
-                continue
-
-            if not self.parsing_groceries:
-                # skip everything else
-                continue
-
-            if self.skip_rest:
-                # if we hit a snag, just skip the rest (easier to recover/debug state)
-                self.data.setdefault("skipped", []).append(line)
-                continue
-
-            if (
-                not line.startswith(" ")
-                and not line.startswith("WT ")
-                and not line.startswith("MR ")
-                and not line.startswith("SC ")
-            ):
-                match_category = CATEGORY_LINE.match(line)
-                if match_category:
-                    self.current_category = match_category.group(1)
-                    continue
-                self.current_category = None
-            elif not self.current_category:
-                self.warning.append(
-                    f"receipt should have a category by this point -- {line}"
-                )
-            elif line == "SC      $3 OFF WYB3             3.00-T":
-                # HACK special case $3 off coupon
-                #  - there is only one of these in the receipts
-                #  - i can't see a pattern
-                #  - there is another SC for rolls (deal for buying 6 at a different price)
-                #  - that coupon is accounted for as adjustments, and is done alongside with a "price you pay"
-                #  - this is just a rebate attached to the end
-                #  - no category, no context, related to some random item bought 3 times before
-                name = "$3 OFF WYB3"
-                cost = "3.00"
-                code = "-T"
-                self.current_item = {
-                    "name": name.strip(),
-                    "price": Decimal(0),
-                    "category": "CONVENIENCE ITEMS",
-                    "taxable": code in TAXABLE_CODES,
-                    "adjustments": [],
-                    "lines": [],
-                }
-                # TODO count by name and pick one with 3 items? then pick it's category
-                self._add_adjustment([name, cost, code], line)
-                self.data["items"].append(self.current_item)
-                continue
-            else:
-                match_savings = re.match(
-                    r"\s+((BONUS BUY )?SAVINGS)\s+(\d+\.\d\d)" + TAX_CODE_GROUP + r"$",
-                    line,
+        self.current_item = None
+
+    def _feed_line(self, line, kind, groups, amount):
+        """
+        line: one line of the receipt
+        kind, groups, amount: @see parse_line
+        """
+        if kind == "blank":
+            # skip lines that are all spaces
+            return
+
+        if "store_number" not in self.data:
+            # throw out all the lines before the store number
+            # (the next line starts the produce)
+            # TODO parse date on reciept (store day time, day time 111 222 33 000000)
+            if kind == "store":
+                self.data["store_number"] = int(groups[0])
+                self.parsing_groceries = True
+            return
+
+        if kind == "stars":
+            # if line all stars, then we are done
+            self.current_item = None
+            self.current_category = None
+            self.parsing_groceries = False
+            return
+
+        if kind == "tax":
+            self.current_item = None
+            self.current_category = None
+            self.parsing_groceries = False
+            [tax] = groups
+            if "tax" in self.data:
+                self._warn("duplicate_tax", old=format_money(self.data["tax"]), new=tax)
+            self.data["tax"] = amount
+            return
+
+        if kind == "balance":
+            self.current_item = None
+            self.current_category = None
+            self.parsing_groceries = False
+            [balance] = groups
+            if "balance" in self.data:
+                self._warn(
+                    "duplicate_balance",
+                    old=format_money(self.data["balance"]),
+                    new=balance,
                 )
-                if match_savings:
-                    [name, _, cost, code] = match_savings.groups()
-                    self._add_adjustment([name, cost, code], line)
-
-                    if self.current_quantity:
-                        self._add_quantity_readout()
-
-                    continue
-
-                match_itemized = ITEMIZED_LINE.match(line)
-                if match_itemized:
-                    [wt, name, cost, code] = match_itemized.groups()
-                    self.current_item = {
-                        "name": name.strip(),
-                        "price": Decimal(0),
-                        "category": self.current_category,
-                        "taxable": code in TAXABLE_CODES,
-                        "adjustments": [],
-                        "lines": [],
-                    }
-                    self._add_adjustment([name, cost, code], line)
-                    self.data["items"].append(self.current_item)
+            self.data["balance"] = amount
+            return
 
-                    if self.current_weight and line.startswith("WT"):
-                        self._add_weight_readout(shouldHaveCost=False)
-                    if self.current_quantity:
-                        self._add_quantity_readout()
+        if not self.parsing_groceries:
+            # skip everything else
+            return
 
-                    continue
+        if self.skip_rest:
+            # if we hit a snag, just skip the rest (easier to recover/debug state)
+            self.data.setdefault("skipped", []).append(line)
+            return
+
+        if kind in ("category", "store", "text"):
+            if kind == "category":
+                self.current_category = groups[0]
+                return
+            self.current_category = None
+        elif not self.current_category:
+            self._warn("missing_category", line=line)
+        elif kind == "coupon":
+            # HACK special case $3 off coupon
+            #  - there is only one of these in the receipts
+            #  - i can't see a pattern
+            #  - there is another SC for rolls (deal for buying 6 at a different price)
+            #  - that coupon is accounted for as adjustments, and is done alongside with a "price you pay"
+            #  - this is just a rebate attached to the end
+            #  - no category, no context, related to some random item bought 3 times before
+            name = "$3 OFF WYB3"
+            cost = "3.00"
+            code = "-T"
+            self.current_item = self._new_item(name, "CONVENIENCE ITEMS", code)
+            # TODO count by name and pick one with 3 items? then pick it's category
+            self._add_adjustment([name, cost, code], line)
+            self.data["items"].append(self.current_item)
+            return
+        elif kind == "savings":
+            [name, _, cost, code] = groups
+            self._add_adjustment([name, cost, code], line, amount)
+
+            if self.current_quantity:
+                self._add_quantity_readout()
+
+            return
+        elif kind == "item":
+            [wt, name, cost, code] = groups
+            self.current_item = self._new_item(name, self.current_category, code)
+            self._add_adjustment([name, cost, code], line, amount)
+            self.data["items"].append(self.current_item)
+
+            if self.current_weight and line.startswith("WT"):
+                self._add_weight_readout(shouldHaveCost=False)
+            if self.current_quantity:
+                self._add_quantity_readout()
+
+            return
+        elif kind == "credit":
+            [sc, name, cost, code] = groups
+            self._add_adjustment([name, cost, code], line, amount)
+            return
+        elif kind == "verify":
+            [text, _] = groups
+            price = amount
+            self.current_item["adjustments"].append(
+                self.adjustment(
+                    {
+                        "name": text,
+                        "price": price,
+                        "type": "verify",
+                    }
+                )
+            )
+            self._add_line(self._line_ref(line))
 
-                match_credit = CREDIT_LINE.match(line)
-                if match_credit:
-                    [sc, name, cost, code] = match_credit.groups()
-                    self._add_adjustment([name, cost, code], line)
-                    continue
+            if self.current_weight:
+                self._add_weight_readout(shouldHaveCost=True)
 
-                match_verify = re.match(
-                    r"\s+(PRICE YOU PAY)\s+(\d+\.\d\d|FREE)\s+", line
-                )
-                if match_verify:
-                    [text, cost] = match_verify.groups()
-                    if cost == "FREE":
-                        cost = "0"
-                    price = Decimal(cost)
-                    self.current_item["adjustments"].append(
-                        {
-                            "name": text,
-                            "price": price,
-                            "type": "verify",
-                        }
-                    )
-                    self.current_item["lines"].append(line)
-
-                    if self.current_weight:
-                        self._add_weight_readout(shouldHaveCost=True)
-
-                    if price == self.current_item["price"]:
-                        self.current_item = None
-                        continue
-                    else:
-                        self.skip_rest = True
-                        self.warning.append(
-                            f"invalid price? {line} -- {self.current_item}"
-                        )
-
-                match_verify = re.match(
-                    r"\s+(PRICE YOU PAY FOR)\s+(\d)\s+(\d+\.\d\d)\s+", line
-                )
-                if match_verify:
-                    [text, quantity, cost] = match_verify.groups()
-                    price = Decimal(cost)
-                    self.current_item["adjustments"].append(
-                        {
-                            "name": text,
-                            "price": price,
-                            "quantity": int(quantity),
-                            "type": "verify",
-                        }
-                    )
-                    self.current_item["lines"].append(line)
-
-                    if price == self.current_item["price"]:
-                        self.current_item = None
-                        continue
-                    else:
-                        self.skip_rest = True
-                        self.warning.append(
-                            f"invalid price? {line} -- {self.current_item}"
-                        )
-
-                match_weight = WEIGHT_LINE.match(line)
-                if match_weight:
-                    self.current_weight = {"line": line, "match": match_weight.groups()}
-                    continue
-
-                match_quantity = QUANTITY_LINE.match(line)
-                if match_quantity:
-                    self.current_quantity = {
-                        "line": line,
-                        "match": match_quantity.groups(),
+            if price == self.current_item["price"]:
+                self.current_item = None
+                return
+            else:
+                self.skip_rest = True
+                self._warn("invalid_price", line=line)
+        elif kind == "verify_for":
+            [text, quantity, _] = groups
+            price = amount
+            self.current_item["adjustments"].append(
+                self.adjustment(
+                    {
+                        "name": text,
+                        "price": price,
+                        "quantity": int(quantity),
+                        "type": "verify",
                     }
-                    continue
+                )
+            )
+            self._add_line(self._line_ref(line))
 
-            self.data.setdefault("skipped", []).append(line)
-            self.skip_rest = True
-            self.warning.append(f"skipping rest -- {line}")
+            if price == self.current_item["price"]:
+                self.current_item = None
+                return
+            else:
+                self.skip_rest = True
+                self._warn("invalid_price", line=line)
+        elif kind == "weight":
+            self.current_weight = {
+                "line": self._line_ref(line),
+                "match": groups,
+                "amount": amount,
+            }
+            return
+        elif kind == "quantity":
+            self.current_quantity = {
+                "line": self._line_ref(line),
+                "match": groups,
+                "amount": amount,
+            }
+            return
 
-        self.current_item = None
+        self.data.setdefault("skipped", []).append(line)
+        self.skip_rest = True
+        self._warn("skipping_rest", line=line)
+
+    def _warn(self, code, **args):
+        self.warning.append(
+            ParseWarning(code, WARNINGS[code], item=self.current_item, **args)
+        )
+
+    def _new_item(self, name, category, code):
+        item = {
+            "name": name.strip(),
+            "price": self.money("0"),
+            "category": category,
+            "taxable": code in TAXABLE_CODES,
+            "adjustments": [],
+        }
+        if self.lines != "drop":
+            item["lines"] = []
+        return self.item(item)
+
+    def _line_ref(self, line):
+        """
+        what to keep in item["lines"] for this line (@see LINES)
+        """
+        if self.lines == "offsets":
+            return self.line_number
+        if self.lines == "drop":
+            return None
+        return line
+
+    def _add_line(self, line_ref, index=None):
+        if line_ref is None:
+            return
+        if index is None:
+            self.current_item["lines"].append(line_ref)
+        else:
+            self.current_item["lines"].insert(index, line_ref)
 
-    def _add_adjustment(self, match, line):
+    def _add_adjustment(self, match, line, amount=None):
         if self.current_item is None:
-            self.warning.append("not currently parsing anything")
+            self._warn("no_current_item")
         if not match or len(match) != 3:
-            self.warning.append("invalid match argument")
+            self._warn("invalid_match")
 
         [name, cost, code] = match
         taxable = code in TAXABLE_CODES
@@ -345,53 +794,56 @@ class ReceiptParser:
 
         # XXX should it be "tax_code !== self.current_item["tax_code"]"
         if taxable != self.current_item["taxable"]:
-            self.warning.append(f"mismatch taxable: {match} -- {self.current_item}")
+            self._warn("mismatch_taxable", match=match)
 
-        amount = Decimal(cost)
+        if amount is None:
+            amount = self.money(cost)
         self.current_item["price"] += amount * scale
         self.current_item["adjustments"].append(
-            {
-                "name": name.strip(),
-                "amount": amount,
-                "code": code,
-                "type": "sum",
-            }
+            self.adjustment(
+                {
+                    "name": name.strip(),
+                    "amount": amount,
+                    "code": code,
+                    "type": "sum",
+                }
+            )
         )
 
-        self.current_item["lines"].append(line)
+        self._add_line(self._line_ref(line))
 
     def _add_weight_readout(self, shouldHaveCost=False):
         [weight_readout, _, cost] = self.current_weight["match"]
-        self.current_item["lines"].insert(
-            -2 if shouldHaveCost else -1, self.current_weight["line"]
-        )
+        price = self.current_weight["amount"]
+        self._add_line(self.current_weight["line"], -2 if shouldHaveCost else -1)
         self.current_weight = None
         last_adjustment = self.current_item["adjustments"][-1]
         last_adjustment["weight_readout"] = weight_readout
         if shouldHaveCost:
             if cost:
-                price = Decimal(cost)
                 last_adjustment["weight_price"] = price
                 if last_adjustment["price"] != price:
-                    self.warning.push(
-                        f"verify price does not match weight cost: {weight_readout}, {cost} -- {self.current_item}"
-                    )
-                if last_adjustment["price"] != price:
-                    self.warning.push(
-                        f"verify price ({last_adjustment['name']}) does not match weight cost: {weight_readout}, {cost} -- {self.current_item}"
+                    self._warn(
+                        "weight_verify_mismatch",
+                        name=last_adjustment["name"],
+                        weight_readout=weight_readout,
+                        cost=cost,
                     )
                 if self.current_item["price"] != price:
-                    self.warning.push(
-                        f"item price ({self.current_item['name']}) does not match weight cost: {weight_readout}, {cost} -- {self.current_item}"
+                    self._warn(
+                        "weight_item_mismatch",
+                        name=self.current_item["name"],
+                        weight_readout=weight_readout,
+                        cost=cost,
                     )
             else:
-                self.warning.push(
-                    f"should be verifying price, but has none? {weight_readout}, {cost} -- {self.current_item}"
+                self._warn(
+                    "weight_missing_cost", weight_readout=weight_readout, cost=cost
                 )
         else:  # not shouldHaveCost:
             if cost:
-                self.warning.push(
-                    f"verify weight price on original item? {weight_readout}, {cost} -- {self.current_item}"
+                self._warn(
+                    "weight_cost_on_item", weight_readout=weight_readout, cost=cost
                 )
             else:
                 # valid
@@ -399,20 +851,20 @@ class ReceiptParser:
 
     def _add_quantity_readout(self):
         [quantity_readout] = self.current_quantity["match"]
-        self.current_item["lines"].insert(-1, self.current_quantity["line"])
+        amount = self.current_quantity["amount"]
+        self._add_line(self.current_quantity["line"], -1)
         self.current_quantity = None
         last_adjustment = self.current_item["adjustments"][-1]
         last_adjustment["quantity_readout"] = quantity_readout
 
-        match_breakdown = re.match(r"^(\d+) @ (\d+\.\d\d)", quantity_readout)
-        if not match_breakdown:
-            self.warning.append(
-                f"could not break down quantity_readout {quantity_readout} -- {self.current_item}"
-            )
+        if amount is None:
+            self._warn("quantity_breakdown", quantity_readout=quantity_readout)
         else:
-            [count, cost] = match_breakdown.groups()
-            amount = int(count) * Decimal(cost)
             if amount != last_adjustment["amount"]:
-                self.warning.append(
-                    f"quantity_readout does not match actual amount? {quantity_readout} {last_adjustment} -- {self.current_item}"
+                self._warn(
+                    "quantity_mismatch",
+                    quantity_readout=quantity_readout,
+                    adjustment=_adjustment_to_decimal(last_adjustment)
+                    if self.cents
+                    else last_adjustment,
                 )
@@ -0,0 +1,159 @@
+# Compact versions of the dicts that make up a transaction
+#  - __slots__ instead of a __dict__ per object (there are millions of items)
+#  - they still act like the dicts (trans["date"], "warning" in trans, setdefault, pop, …)
+#    so the rest of the pipeline doesn't need to know which one it has
+#  - a field that hasn't been set is the same as a missing key
+
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        """
+        plain dicts all the way down (e.g. for json)
+        """
+        return {key: _to_plain(value) for key, value in self.items()}
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(f"{type(self).__name__} has no field {key}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = getattr(self, key)
+        delattr(self, key)
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == _to_plain(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())})"
+
+
+class Adjustment(Record):
+    """
+    one line that changes the price of an item (@see ReceiptParser._add_adjustment)
+    """
+
+    __slots__ = (
+        "name",
+        "amount",
+        "code",
+        "type",
+        "price",
+        "quantity",
+        "weight_readout",
+        "weight_price",
+        "quantity_readout",
+    )
+
+
+class Item(Record):
+    """
+    one thing that was bought
+    """
+
+    __slots__ = ("name", "price", "category", "taxable", "adjustments", "lines")
+
+    @classmethod
+    def from_dict(cls, data):
+        item = cls(**data)
+        if "adjustments" in item:
+            item.adjustments = [
+                Adjustment.from_dict(adjustment) for adjustment in item.adjustments
+            ]
+        return item
+
+
+class Transaction(Record):
+    """
+    one email, it picks up fields as it goes through mail.py, html.py, date.py and receipt.py
+    """
+
+    __slots__ = (
+        "filename",
+        "idx",
+        "date_raw",
+        "id",
+        "duplicates",
+        "body_html",
+        "body_text",
+        "receipt_raw",
+        "date",
+        "date_epoch",
+        "receipt_data",
+        "warning",
+    )
+
+    @classmethod
+    def from_dict(cls, data):
+        trans = cls(**data)
+        if "receipt_data" in trans:
+            trans.receipt_data = {
+                **trans.receipt_data,
+                "items": [Item.from_dict(item) for item in trans.receipt_data["items"]],
+            }
+        return trans
+
+
+def _to_plain(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: _to_plain(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    return value
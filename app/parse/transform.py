@@ -1,12 +1,22 @@
+import datetime
+from array import array
 from decimal import Decimal
 from enum import Enum
 
+from app.parse.money import to_cents
 from app.parse.receipt import CATEGORIES
 
+# TransformFormat.Columnar category codes (index into CATEGORIES), for anything else
+UNKNOWN_CATEGORY = -1
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+# int64 min is NaT (missing date) as datetime64
+NAT = -(2**63)
+
 
 class TransformFormat(Enum):
     List = 1
     Table = 2
+    Columnar = 3
 
 
 # @warnings.deprecated("only needed if we use/learn an external tool")
@@ -14,7 +24,12 @@ def transform_receipt_parsed(transactions, *, format: TransformFormat):
     """
     Given a list of items from a receipt (transaction date, item name, item price, item category, etc),
     convert this into some kind of data table to be used with a library
+
+    Columnar returns a dict of numpy arrays instead of a list (@see _transform_receipt_parsed_to_columnar)
     """
+    if format == TransformFormat.Columnar:
+        return _transform_receipt_parsed_to_columnar(transactions)
+
     data_dump = []
     for trans in transactions:
         if "receipt_data" in trans:
@@ -44,3 +59,56 @@ def _transform_receipt_parsed_to_table(trans):
         category = item["category"]
         agg[category] = agg.get(category, Decimal("0")) + item["price"]
     return agg
+
+
+def _transform_receipt_parsed_to_columnar(transactions):
+    """
+    One entry per item, one array per field (one pass, no dict per item)
+     - date: datetime64[s] (UTC), NaT if the transaction has no date
+     - category: int16 index into CATEGORIES (UNKNOWN_CATEGORY if it's not one of them)
+     - price: int64 cents
+     - taxable: bool
+     - trans: int32 index into transactions
+    """
+    import numpy as np
+
+    dates = array("q")
+    categories = array("h")
+    prices = array("q")
+    taxable = array("b")
+    trans_index = array("i")
+    for index, trans in enumerate(transactions):
+        if "receipt_data" not in trans:
+            continue
+        epoch = _date_epoch(trans)
+        for item in trans["receipt_data"]["items"]:
+            dates.append(epoch)
+            categories.append(CATEGORY_CODES.get(item["category"], UNKNOWN_CATEGORY))
+            price = item["price"]
+            prices.append(price if isinstance(price, int) else to_cents(price))
+            taxable.append(item.get("taxable", False))
+            trans_index.append(index)
+
+    return {
+        "date": np.frombuffer(dates, dtype=np.int64).view("datetime64[s]"),
+        "category": np.frombuffer(categories, dtype=np.int16),
+        "price": np.frombuffer(prices, dtype=np.int64),
+        "taxable": np.frombuffer(taxable, dtype=np.int8).view(np.bool_),
+        "trans": np.frombuffer(trans_index, dtype=np.int32),
+    }
+
+
+def _date_epoch(trans):
+    """
+    trans["date_epoch"], or work it out from trans["date"] (older/test data, maybe still an iso string)
+    """
+    if "date_epoch" in trans:
+        return trans["date_epoch"]
+    date = trans.get("date")
+    if date is None:
+        return NAT
+    if isinstance(date, str):
+        date = datetime.datetime.fromisoformat(date)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp())
@@ -0,0 +1,62 @@
+class ParseWarning:
+    """
+    A warning that isn't turned into text until it's printed or saved
+    (some of them include the whole item, and most of them are never looked at)
+
+    code: what kind of warning (@see count_warnings)
+    message: str.format template, filled in with item and args
+    item: the item the warning is about (a reference, not a copy)
+    trans_id: id of the transaction, filled in when the warning is added to it
+    """
+
+    __slots__ = ("code", "message", "item", "trans_id", "args")
+
+    def __init__(self, code, message, item=None, trans_id=None, **args):
+        self.code = code
+        self.message = message
+        self.item = item
+        self.trans_id = trans_id
+        self.args = args
+
+    def __str__(self):
+        return self.message.format(item=self.item, **self.args)
+
+    def __repr__(self):
+        return f"ParseWarning({self.code!r}, {str(self)!r})"
+
+    def to_dict(self):
+        """
+        the text, with its code (to save with datetime_serializer)
+        """
+        return {"code": self.code, "message": str(self)}
+
+    @classmethod
+    def from_dict(cls, data, trans_id=None):
+        """
+        a warning saved with to_dict (it's already text, so it isn't a template anymore)
+        """
+        message = data["message"].replace("{", "{{").replace("}", "}}")
+        return cls(data["code"], message, trans_id=trans_id)
+
+    def __eq__(self, other):
+        if isinstance(other, ParseWarning):
+            return self.code == other.code and str(self) == str(other)
+        if isinstance(other, str):
+            return str(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+
+def count_warnings(transactions):
+    """
+    How many of each warning code there are (plain string warnings are "other")
+
+    return dict of code: count
+    """
+    counts = {}
+    for trans in transactions:
+        for warning in trans.get("warning", []):
+            code = warning.code if isinstance(warning, ParseWarning) else "other"
+            counts[code] = counts.get(code, 0) + 1
+    return counts
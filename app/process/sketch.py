@@ -0,0 +1,221 @@
+import heapq
+import math
+import random
+
+from app.parse.money import cents_to_decimal, to_cents
+
+# how many names each SpaceSaving keeps track of (more is closer to exact)
+TOP_ITEMS_CAPACITY = 1000
+TOP_ITEMS_K = 10
+TOP_ITEMS_GRAPH_WIDTH = 20
+# KllSketch size, the rank error is around 1.7 / k (k=200 is about ±1%)
+KLL_K = 200
+
+
+class SpaceSaving:
+    """
+    Approximate heavy hitters in a fixed amount of memory (Space-Saving, with weights)
+    https://www.cs.ucsb.edu/sites/default/files/documents/2005-23.pdf
+
+    Once there are `capacity` keys, a new key replaces the smallest one and starts from its count.
+    For every key in counts: count - error <= true total <= count
+    Any key with a true total over total / capacity is always in counts.
+
+    counts: {key: [count, error]}
+    total: sum of all the weights
+    """
+
+    def __init__(self, capacity=TOP_ITEMS_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        # (count, key), with old entries left in until they come up (@see _pop_min)
+        self._heap = []
+
+    def add(self, key, weight=1):
+        """
+        weight: has to be positive
+        """
+        if weight <= 0:
+            raise ValueError(f"SpaceSaving weight has to be positive: {weight}")
+        self.total += weight
+        if key in self.counts:
+            self.counts[key][0] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = [weight, 0]
+        else:
+            smallest = self._pop_min()
+            error = self.counts.pop(smallest)[0]
+            self.counts[key] = [error + weight, error]
+        heapq.heappush(self._heap, (self.counts[key][0], key))
+        if len(self._heap) > self.capacity * 4:
+            self._heap = [(count, key) for key, (count, _) in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k=TOP_ITEMS_K):
+        """
+        return [(key, count, error)], biggest count first
+        the true total is between count - error and count
+        """
+        return [
+            (key, count, error)
+            for key, (count, error) in sorted(
+                self.counts.items(), key=lambda entry: entry[1][0], reverse=True
+            )[:k]
+        ]
+
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            # skip entries for keys that have gone up since (or were replaced)
+            if key in self.counts and self.counts[key][0] == count:
+                return key
+
+
+class TopItems:
+    """
+    Which item names cost the most, and which are bought the most (from parse_receipt_raw)
+    Items with a price of zero or less (e.g. free, refunds) aren't counted for spend.
+    """
+
+    def __init__(self, capacity=TOP_ITEMS_CAPACITY):
+        self.spend = SpaceSaving(capacity)
+        self.count = SpaceSaving(capacity)
+
+    def add(self, transactions):
+        for trans in transactions:
+            if "receipt_data" not in trans:
+                continue
+            for item in trans["receipt_data"]["items"]:
+                name = item["name"]
+                price = item["price"]
+                cents = price if isinstance(price, int) else to_cents(price)
+                self.count.add(name)
+                if cents > 0:
+                    self.spend.add(name, cents)
+        return self
+
+
+def sketch_graph_top(sketch, k=TOP_ITEMS_K, money=False, width=TOP_ITEMS_GRAPH_WIDTH):
+    """
+    Table of sketch.top(k), in the style of stats_graph_agg (but linear)
+
+    money: the counts are cents
+    """
+    # (stats imports this module)
+    from app.process.stats import GRAPH_BLOCK, GRAPH_BLOCK_HALF, GRAPH_BLOCK_NONE
+
+    rows = []
+    for key, count, error in sketch.top(k):
+        if money:
+            rows.append(
+                (key, count, str(cents_to_decimal(count)), str(cents_to_decimal(error)))
+            )
+        else:
+            rows.append((key, count, str(count), str(error)))
+    if not rows:
+        return "\n"
+    largest = rows[0][1]
+    sum_size = max(len(row[2]) for row in rows)
+    error_size = max(len(row[3]) for row in rows)
+    graph = "\n"
+    for key, count, sum, error in rows:
+        size = count / largest * width
+        g = GRAPH_BLOCK * int(size)
+        if size - int(size) >= 0.5:
+            # same as stats_graph_agg, the half block goes on the left end
+            g = GRAPH_BLOCK_HALF + g
+        g = g.rjust(width, GRAPH_BLOCK_NONE)
+        graph += f" {g}  {sum.rjust(sum_size)} ±{error.ljust(error_size)} · {key}\n"
+    return graph
+
+
+class KllSketch:
+    """
+    Approximate quantiles in a fixed amount of memory (KLL)
+    https://arxiv.org/abs/1603.05346
+
+    compactors[h] holds values that each stand for 2**h of the values that were added.
+    When a level fills up it's sorted and every other value moves up a level (starting at a random one).
+    Sketches of the same k can be merged, e.g. per worker or per month.
+
+    n: how many values were added
+    seed: for the coin flips, so the same values give the same sketch
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.seed = seed
+        self.n = 0
+        self.compactors = [[]]
+        self._random = random.Random(seed)
+
+    def add(self, value):
+        self.compactors[0].append(value)
+        self.n += 1
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        """
+        return a new KllSketch with both of them
+        """
+        if other.k != self.k:
+            raise ValueError(f"can't merge KllSketch k={self.k} with k={other.k}")
+        merged = KllSketch(self.k, self.seed)
+        merged.n = self.n + other.n
+        merged.compactors = [
+            [] for _ in range(max(len(self.compactors), len(other.compactors)))
+        ]
+        for sketch in [self, other]:
+            for h, compactor in enumerate(sketch.compactors):
+                merged.compactors[h].extend(compactor)
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        """
+        q: 0 to 1 (0.5 is the median)
+        return the value at that rank, or None if nothing was added
+        """
+        weighted = sorted(self._weighted())
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        rank = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= rank:
+                return value
+        return weighted[-1][0]
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
+
+    def _weighted(self):
+        return [
+            (value, 2**h)
+            for h, compactor in enumerate(self.compactors)
+            for value in compactor
+        ]
+
+    def _capacity(self, h):
+        # the top level gets k, each one below it gets 2/3 of the one above
+        depth = len(self.compactors) - h - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.compactors):
+            compactor = self.compactors[h]
+            if len(compactor) >= self._capacity(h):
+                if h + 1 == len(self.compactors):
+                    self.compactors.append([])
+                compactor.sort()
+                # an odd one out stays where it is, so the weights still add up to n
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                offset = self._random.getrandbits(1)
+                self.compactors[h + 1].extend(compactor[offset::2])
+                self.compactors[h] = leftover
+            h += 1
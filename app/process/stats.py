@@ -1,19 +1,31 @@
+import datetime
+import json
 import math
+import os
 from decimal import Decimal
 
+from app.parse.money import cents_to_decimal, to_cents
 from app.parse.receipt import CATEGORIES
+from app.parse.transform import UNKNOWN_CATEGORY
+from app.parse.warning import count_warnings
+from app.process.sketch import KLL_K, KllSketch
 
 GRAPH_BLOCK = "█"
 GRAPH_BLOCK_HALF = "▐"
 GRAPH_BLOCK_NONE = " "
+# main sums the categories with numpy (@see stats_sum_columnar), instead of item by item
+COLUMNAR = False
 
 
-def stats_sum_receipt_parsed(transactions):
+def stats_sum_receipt_parsed(transactions, cents=False):
     """
     Given a list of items from a receipt (transaction date, item name, item price, item category, etc),
     sum all of the item categories
+
+    cents: item prices are int cents (@see app.parse.receipt.CENTS), the sums are still Decimal
     """
-    cats = {category: Decimal("0") for category in CATEGORIES}
+    zero = 0 if cents else Decimal("0")
+    cats = {category: zero for category in CATEGORIES}
     agg = {
         "date_min": None,
         "date_max": None,
@@ -32,10 +44,497 @@ def stats_sum_receipt_parsed(transactions):
 
             for item in trans["receipt_data"]["items"]:
                 category = item["category"]
-                cats[category] = cats.get(category, Decimal("0")) + item["price"]
+                cats[category] = cats.get(category, zero) + item["price"]
+    if cents:
+        agg["cats"] = {
+            category: cents_to_decimal(sum) for category, sum in cats.items()
+        }
+    return agg
+
+
+class Aggregate:
+    """
+    stats_sum_receipt_parsed in pieces, e.g. one per worker or per dump file, combined with merge
+    (merge is associative and Aggregate() changes nothing, so they can be combined in any grouping)
+
+    date_min, date_max: of the transactions with receipt_data
+    cents: {category: int cents}
+    counts: {category: number of items}
+    warnings: {code: count} (@see count_warnings)
+    """
+
+    def __init__(self, transactions=()):
+        self.date_min = None
+        self.date_max = None
+        self.cents = {}
+        self.counts = {}
+        self.warnings = {}
+        self.add(transactions)
+
+    def add(self, transactions):
+        for trans in transactions:
+            _add_counts(self.warnings, count_warnings([trans]))
+            if "receipt_data" not in trans:
+                continue
+            self._add_dates(trans["date"], trans["date"])
+            for item in trans["receipt_data"]["items"]:
+                category = item["category"]
+                price = item["price"]
+                self.cents[category] = self.cents.get(category, 0) + (
+                    price if isinstance(price, int) else to_cents(price)
+                )
+                self.counts[category] = self.counts.get(category, 0) + 1
+        return self
+
+    def merge(self, other):
+        """
+        return a new Aggregate with both of them
+        """
+        merged = Aggregate()
+        for aggregate in [self, other]:
+            if aggregate.date_min is not None:
+                merged._add_dates(aggregate.date_min, aggregate.date_max)
+            _add_counts(merged.cents, aggregate.cents)
+            _add_counts(merged.counts, aggregate.counts)
+            _add_counts(merged.warnings, aggregate.warnings)
+        return merged
+
+    def to_agg(self):
+        """
+        the agg from stats_sum_receipt_parsed (e.g. for stats_graph_agg)
+        """
+        cats = {category: cents_to_decimal(0) for category in CATEGORIES}
+        for category, cents in self.cents.items():
+            cats[category] = cents_to_decimal(cents)
+        return {
+            "date_min": self.date_min,
+            "date_max": self.date_max,
+            "cats": cats,
+        }
+
+    def _add_dates(self, date_min, date_max):
+        if self.date_min is None:
+            self.date_min = date_min
+            self.date_max = date_max
+        else:
+            self.date_min = min(self.date_min, date_min)
+            self.date_max = max(self.date_max, date_max)
+
+    def __eq__(self, other):
+        if not isinstance(other, Aggregate):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    __hash__ = None
+
+
+def _add_counts(counts, other):
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+def stats_price_quantiles(transactions, sketches=None, k=KLL_K):
+    """
+    Item prices per category, as a quantile sketch (one pass, fixed memory per category)
+    e.g. the median or p95 price, to watch for prices going up
+
+    sketches: keep adding to these (e.g. from another worker or month), otherwise start new ones
+    return {category: KllSketch of int cents}
+    """
+    sketches = {} if sketches is None else sketches
+    for trans in transactions:
+        if "receipt_data" not in trans:
+            continue
+        for item in trans["receipt_data"]["items"]:
+            category = item["category"]
+            if category not in sketches:
+                sketches[category] = KllSketch(k)
+            price = item["price"]
+            sketches[category].add(price if isinstance(price, int) else to_cents(price))
+    return sketches
+
+
+def stats_merge_price_quantiles(sketches, other):
+    """
+    return new {category: KllSketch} with both (@see stats_price_quantiles)
+    """
+    merged = {}
+    for part in [sketches, other]:
+        for category, sketch in part.items():
+            if category not in merged:
+                # a copy, so adding to merged doesn't change sketches/other
+                merged[category] = KllSketch(sketch.k, sketch.seed)
+            merged[category] = merged[category].merge(sketch)
+    return merged
+
+
+def stats_quantile_agg(sketches, q):
+    """
+    The price at quantile q for each category, as an agg for stats_graph_agg (no dates)
+    """
+    cats = {category: cents_to_decimal(0) for category in CATEGORIES}
+    for category, sketch in sketches.items():
+        if sketch.n:
+            cats[category] = cents_to_decimal(sketch.quantile(q))
+    return {
+        "date_min": None,
+        "date_max": None,
+        "cats": cats,
+    }
+
+
+def stats_sum_columnar(columns, transactions=None):
+    """
+    Same as stats_sum_receipt_parsed, for TransformFormat.Columnar (numpy, no loop over the items)
+     - items with an unknown category are summed under None
+     - the dates only come from transactions that have items
+
+    transactions: what columns was made from, so date_min/date_max can be the original dates
+      (otherwise they are UTC)
+    """
+    import numpy as np
+
+    codes = columns["category"].astype(np.intp) - UNKNOWN_CATEGORY
+    # float64 weights are exact for int cents up to 2**53
+    sums = np.bincount(
+        codes, weights=columns["price"], minlength=len(CATEGORIES) + 1
+    ).round()
+    cats = {
+        category: cents_to_decimal(int(sum))
+        for category, sum in zip(CATEGORIES, sums[1:])
+    }
+    if np.any(codes == 0):
+        cats[None] = cents_to_decimal(int(sums[0]))
+    agg = {
+        "date_min": None,
+        "date_max": None,
+        "cats": cats,
+    }
+
+    has_date = ~np.isnat(columns["date"])
+    if np.any(has_date):
+        epochs = columns["date"][has_date].astype(np.int64)
+        trans_index = columns["trans"][has_date]
+        for key, index in [
+            ("date_min", epochs.argmin()),
+            ("date_max", epochs.argmax()),
+        ]:
+            if transactions is None:
+                agg[key] = datetime.datetime.fromtimestamp(
+                    int(epochs[index]), datetime.timezone.utc
+                )
+            else:
+                agg[key] = transactions[trans_index[index]]["date"]
     return agg
 
 
+class DateRangeIndex:
+    """
+    Category sums for any [start, end) date range, without going through the items again
+    (@see stats_sum_date_range)
+
+    columns: TransformFormat.Columnar
+    transactions: what columns was made from, so date_min/date_max can be the original dates
+
+    dates: sorted unique epoch seconds (items without a date are left out)
+    prefix: prefix[i] is the cents per category for everything before dates[i]
+      (column 0 is the unknown categories, then CATEGORIES)
+    """
+
+    def __init__(self, columns, transactions=None):
+        import numpy as np
+
+        has_date = ~np.isnat(columns["date"])
+        epochs = columns["date"][has_date].astype(np.int64)
+        codes = columns["category"][has_date].astype(np.intp) - UNKNOWN_CATEGORY
+        prices = columns["price"][has_date]
+        trans_index = columns["trans"][has_date]
+
+        self.dates, first, inverse = np.unique(
+            epochs, return_index=True, return_inverse=True
+        )
+        width = len(CATEGORIES) + 1
+        # cents per (date, category), float64 weights are exact for int cents up to 2**53
+        sums = np.bincount(
+            inverse * width + codes,
+            weights=prices,
+            minlength=len(self.dates) * width,
+        )
+        sums = sums.round().astype(np.int64).reshape(len(self.dates), width)
+        self.prefix = np.zeros((len(self.dates) + 1, width), dtype=np.int64)
+        np.cumsum(sums, axis=0, out=self.prefix[1:])
+        # how many items with an unknown category, same for prefix
+        self.unknown = np.zeros(len(self.dates) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(inverse[codes == 0], minlength=len(self.dates)),
+            out=self.unknown[1:],
+        )
+        # one transaction for each date
+        self.trans = trans_index[first]
+        self.transactions = transactions
+
+
+def stats_sum_date_range(index, start=None, end=None):
+    """
+    Same agg as stats_sum_receipt_parsed, for the items with start <= date < end
+    (two binary searches and a subtraction)
+
+    index: DateRangeIndex
+    start, end: datetime, date (midnight UTC) or epoch seconds, None for no limit
+    """
+    lo = 0 if start is None else index.dates.searchsorted(_epoch(start))
+    hi = len(index.dates) if end is None else index.dates.searchsorted(_epoch(end))
+    hi = max(lo, hi)
+    sums = index.prefix[hi] - index.prefix[lo]
+    cats = {
+        category: cents_to_decimal(int(sum))
+        for category, sum in zip(CATEGORIES, sums[1:])
+    }
+    if index.unknown[hi] - index.unknown[lo]:
+        cats[None] = cents_to_decimal(int(sums[0]))
+    agg = {
+        "date_min": None,
+        "date_max": None,
+        "cats": cats,
+    }
+    if lo < hi:
+        for key, position in [("date_min", lo), ("date_max", hi - 1)]:
+            if index.transactions is None:
+                agg[key] = datetime.datetime.fromtimestamp(
+                    int(index.dates[position]), datetime.timezone.utc
+                )
+            else:
+                agg[key] = index.transactions[index.trans[position]]["date"]
+    return agg
+
+
+def stats_rolling_sums(transactions, window, step=datetime.timedelta(days=1)):
+    """
+    Spend per category over a moving window (e.g. 7, 30, 90 days), for trend graphs
+    one pass over the transactions: each one is added when the window gets to it, and taken off when it leaves
+    (so it's O(transactions + points), no matter how wide the window is)
+
+    window, step: timedelta
+    return {"dates": [datetime (UTC)], "cats": {category: [Decimal]}}
+      cats[category][i] is the sum for dates[i] - window < date <= dates[i]
+      dates go from the first transaction to the last one, every step
+    """
+    window = math.ceil(window.total_seconds())
+    step = math.ceil(step.total_seconds())
+    if step <= 0:
+        raise ValueError(f"rolling sums step has to be positive: {step}s")
+    entries = []
+    for trans in transactions:
+        if "receipt_data" not in trans:
+            continue
+        cents = {}
+        for item in trans["receipt_data"]["items"]:
+            price = item["price"]
+            cents[item["category"]] = cents.get(item["category"], 0) + (
+                price if isinstance(price, int) else to_cents(price)
+            )
+        epoch = trans["date_epoch"] if "date_epoch" in trans else _epoch(trans["date"])
+        entries.append((epoch, cents))
+    # usually already in order, which makes this one pass too
+    entries.sort(key=lambda entry: entry[0])
+
+    running = {category: 0 for category in CATEGORIES}
+    series = {"dates": [], "cats": {category: [] for category in CATEGORIES}}
+    if not entries:
+        return series
+    enter = leave = 0
+    point = entries[0][0]
+    while True:
+        while enter < len(entries) and entries[enter][0] <= point:
+            _add_counts(running, entries[enter][1])
+            enter += 1
+        while leave < enter and entries[leave][0] <= point - window:
+            for category, cents in entries[leave][1].items():
+                running[category] -= cents
+            leave += 1
+
+        series["dates"].append(
+            datetime.datetime.fromtimestamp(point, datetime.timezone.utc)
+        )
+        for category, cents in running.items():
+            if category not in series["cats"]:
+                # first time seeing a category that isn't in CATEGORIES
+                series["cats"][category] = [0] * (len(series["dates"]) - 1)
+            series["cats"][category].append(cents)
+        if enter == len(entries):
+            break
+        point += step
+
+    series["cats"] = {
+        category: [cents_to_decimal(cents) for cents in sums]
+        for category, sums in series["cats"].items()
+    }
+    return series
+
+
+def _epoch(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        # dates are whole seconds, so date >= 1.5 is the same as date >= 2
+        return math.ceil(value.timestamp())
+    if isinstance(value, datetime.date):
+        return _epoch(datetime.datetime.combine(value, datetime.time()))
+    return int(value)
+
+
+class RollupCube:
+    """
+    Cents and item counts per day per category, kept up to date as new transactions come in
+    (so a weekly/monthly report doesn't have to go through the transactions again)
+
+    days: {"2025-04-26": {category: [cents, count]}}, by the date on the transaction (not UTC)
+    seen: {date_raw: [day, cents, count]} of the transactions that have been added (adding one again does nothing)
+        same as dedup_transactions, the same email in another file is the same transaction
+        cents and count are the whole receipt, so sync can tell when it was parsed again and came out different
+    """
+
+    def __init__(self, days=None, seen=None):
+        self.days = days if days is not None else {}
+        self.seen = seen if seen is not None else {}
+
+    def add(self, transactions):
+        """
+        return how many transactions were added
+        """
+        added = 0
+        for trans in transactions:
+            if "receipt_data" not in trans or "date" not in trans:
+                continue
+            if trans["date_raw"] in self.seen:
+                continue
+            day_key = trans["date"].date().isoformat()
+            added += 1
+            day = self.days.setdefault(day_key, {})
+            total = 0
+            for item in trans["receipt_data"]["items"]:
+                cents = _item_cents(item)
+                cell = day.setdefault(item["category"], [0, 0])
+                cell[0] += cents
+                cell[1] += 1
+                total += cents
+            self.seen[trans["date_raw"]] = [
+                day_key,
+                total,
+                len(trans["receipt_data"]["items"]),
+            ]
+        return added
+
+    def sync(self, transactions):
+        """
+        Match the cube to all the transactions (e.g. from merge_transactions)
+        new ones are added, and the days that lost one or have one that changed
+        (file removed, or parsed again with a different date or receipt) are rebuilt
+
+        return how many transactions are new
+        """
+        current = {
+            trans["date_raw"]: [
+                trans["date"].date().isoformat(),
+                sum(_item_cents(item) for item in trans["receipt_data"]["items"]),
+                len(trans["receipt_data"]["items"]),
+            ]
+            for trans in transactions
+            if "receipt_data" in trans and "date" in trans
+        }
+        new = sum(date_raw not in self.seen for date_raw in current)
+        stale = {
+            entry[0]
+            for date_raw, entry in self.seen.items()
+            if current.get(date_raw) != entry
+        }
+        if stale:
+            for day in stale:
+                self.days.pop(day, None)
+            self.seen = {
+                date_raw: entry
+                for date_raw, entry in self.seen.items()
+                if entry[0] not in stale and date_raw in current
+            }
+        self.add(transactions)
+        return new
+
+    def rollup(self, period="day"):
+        """
+        period: "day", "week" (ISO, "2025-W17") or "month" ("2025-04")
+        return {bucket: {category: [cents, count]}}, sorted by bucket
+        """
+        buckets = {}
+        for day, cells in sorted(self.days.items()):
+            bucket = buckets.setdefault(ROLLUP_PERIODS[period](day), {})
+            for category, (cents, count) in cells.items():
+                cell = bucket.setdefault(category, [0, 0])
+                cell[0] += cents
+                cell[1] += count
+        return buckets
+
+    def agg(self, period, bucket):
+        """
+        The same agg as stats_sum_receipt_parsed, for one bucket of rollup(period) (e.g. for stats_graph_agg)
+        date_min/date_max are the first/last day in the bucket (as dates)
+        """
+        days = [
+            day for day in sorted(self.days) if ROLLUP_PERIODS[period](day) == bucket
+        ]
+        cents = {category: 0 for category in CATEGORIES}
+        for day in days:
+            for category, (sum, _) in self.days[day].items():
+                cents[category] = cents.get(category, 0) + sum
+        return {
+            "date_min": datetime.date.fromisoformat(days[0]) if days else None,
+            "date_max": datetime.date.fromisoformat(days[-1]) if days else None,
+            "cats": {
+                category: cents_to_decimal(sum) for category, sum in cents.items()
+            },
+        }
+
+    def save(self, filepath):
+        # write then rename, so a crash doesn't leave half a file
+        temp_path = f"{filepath}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(json.dumps({"days": self.days, "seen": self.seen}))
+        os.replace(temp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath):
+        """
+        return the saved RollupCube, or an empty one if there isn't a file yet
+        """
+        if not os.path.isfile(filepath):
+            return cls()
+        with open(filepath, "r") as file:
+            data = json.loads(file.read())
+        if isinstance(data["seen"], list) or any(
+            isinstance(entry, str) for entry in data["seen"].values()
+        ):
+            # saved by trans id, or without the cents and count, start over (sync adds everything back)
+            return cls()
+        return cls(data["days"], data["seen"])
+
+
+def _item_cents(item):
+    price = item["price"]
+    return price if isinstance(price, int) else to_cents(price)
+
+
+def _week(day):
+    year, week, _ = datetime.date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+# RollupCube.rollup, day ("2025-04-26") to bucket
+ROLLUP_PERIODS = {
+    "day": lambda day: day,
+    "week": _week,
+    "month": lambda day: day[:7],
+}
+
+
 def stats_graph_agg(agg, half=False, log_base=2):
     """
     TODO this needs a better name, and argument name
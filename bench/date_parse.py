@@ -0,0 +1,59 @@
+# Compare parse_date (app/parse/date.py) with the strptime it replaced
+#
+# python3 -m bench.date_parse [repeat]
+
+import datetime
+import random
+import sys
+import timeit
+
+from app.parse.date import _parse_date_fixed, format_string, parse_date
+
+
+def make_dates(count=1000, unique=100):
+    """
+    count date headers, with only `unique` different ones (like a batch of emails)
+    """
+    random.seed(0)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    dates = [
+        (start + datetime.timedelta(seconds=random.randrange(400 * 86400))).strftime(
+            format_string
+        )
+        for _ in range(unique)
+    ]
+    return [random.choice(dates) for _ in range(count)]
+
+
+def strptime_all(dates):
+    return [datetime.datetime.strptime(date_raw, format_string) for date_raw in dates]
+
+
+def fixed_all(dates):
+    return [_parse_date_fixed(date_raw) for date_raw in dates]
+
+
+def parse_date_all(dates):
+    return [parse_date(date_raw)[0] for date_raw in dates]
+
+
+def main(repeat=100):
+    dates = make_dates()
+    print(f"{len(dates)} dates, {len(set(dates))} unique, x{repeat}")
+
+    if not (strptime_all(dates) == fixed_all(dates) == parse_date_all(dates)):
+        raise AssertionError("parsers do not match")
+
+    for name, run in [
+        ("strptime", lambda: strptime_all(dates)),
+        ("fixed layout", lambda: fixed_all(dates)),
+        ("parse_date (memo)", lambda: parse_date_all(dates)),
+    ]:
+        seconds = min(timeit.repeat(run, number=repeat, repeat=3))
+        print(
+            f"{name:>17}: {seconds:.3f}s, {seconds / repeat / len(dates) * 1e6:.2f}us/date"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
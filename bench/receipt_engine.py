@@ -0,0 +1,68 @@
+# Compare the ReceiptParser engines (@see ENGINE in app/parse/receipt.py) on the test data
+#
+# python3 -m bench.receipt_engine [repeat]
+
+import sys
+import timeit
+
+from app.parse.html import parse_body_html
+from app.parse.mail import parse_mbox_file
+from app.parse.receipt import ReceiptParser, parse_line
+
+RECEIPT_FILES = [
+    "data/test_data/receipt_raw_sample.txt",
+    "data/test_data/receipt_raw_storecoupon.txt",
+]
+MBOX_FILES = ["data/test_data/test_simple.mbox"]
+
+
+def load_receipts():
+    receipts = []
+    for filename in RECEIPT_FILES:
+        with open(filename, "r", encoding="utf-8") as file:
+            receipts.append([line.strip('"') for line in file.read().splitlines()])
+    for filename in MBOX_FILES:
+        transactions = parse_mbox_file(filename)
+        parse_body_html(transactions)
+        receipts.extend(
+            trans["receipt_raw"] for trans in transactions if "receipt_raw" in trans
+        )
+    return receipts
+
+
+def feed_all(receipts, engine):
+    results = []
+    for receipt_raw in receipts:
+        parser = ReceiptParser(engine=engine)
+        parser.feed(receipt_raw)
+        results.append((parser.data, [str(w) for w in parser.warning]))
+    return results
+
+
+def lines_cold(receipts):
+    # parse_line is memoized, start each round without it
+    parse_line.cache_clear()
+    return feed_all(receipts, "lines")
+
+
+def main(repeat=200):
+    receipts = load_receipts()
+    line_count = sum(len(receipt_raw) for receipt_raw in receipts)
+    print(f"{len(receipts)} receipts, {line_count} lines, x{repeat}")
+
+    if feed_all(receipts, "scan") != feed_all(receipts, "lines"):
+        raise AssertionError("engines do not match")
+
+    for name, run in [
+        ("lines (memo)", lambda: feed_all(receipts, "lines")),
+        ("lines (no memo)", lambda: lines_cold(receipts)),
+        ("scan", lambda: feed_all(receipts, "scan")),
+    ]:
+        seconds = min(timeit.repeat(run, number=repeat, repeat=3))
+        print(
+            f"{name:>16}: {seconds:.3f}s, {seconds / repeat / line_count * 1e6:.2f}us/line"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -1,21 +1,84 @@
+import datetime
 import json
 import os
 import sys
 
 from app.parse.date import datetime_serializer, parse_date_raw
 from app.parse.html import parse_body_html
-from app.parse.mail import traverse_files_recursive
-from app.parse.receipt import parse_receipt_raw
-from app.process.stats import stats_graph_agg, stats_sum_receipt_parsed
+from app.parse.mail import (
+    RECORDS,
+    MailFilter,
+    merge_receipt_raw,
+    merge_transactions,
+    traverse_files_recursive,
+)
+from app.parse.money import format_money
+from app.parse.receipt import (
+    CENTS,
+    parse_receipt_raw,
+    receipt_data_deserializer,
+    receipt_data_serializer,
+    use_parse_cache,
+)
+from app.parse.records import Transaction
+from app.parse.transform import TransformFormat, transform_receipt_parsed
+from app.parse.warning import ParseWarning, count_warnings
+from app.process.sketch import TopItems, sketch_graph_top
+from app.process.stats import (
+    COLUMNAR,
+    RollupCube,
+    stats_graph_agg,
+    stats_price_quantiles,
+    stats_quantile_agg,
+    stats_sum_columnar,
+    stats_sum_receipt_parsed,
+)
 
+MANIFEST = "data/manifest.json"
+RECEIPT_PARSED = "data/receipt_parsed.json"
+# trans id -> receipt lines
+RECEIPT_RAW = "data/receipt_raw.json"
+# parsed receipts, to skip parse_receipt_raw for the ones that haven't changed (make clean leaves it alone)
+PARSE_CACHE = "data/parse_cache"
+# day x category sums, new receipts are added each run (@see RollupCube)
+ROLLUP = "data/rollup.json"
 
-def eml_to_stats(data_dumps_directory):
-    transactions = traverse_files_recursive(data_dumps_directory)
+
+def eml_to_stats(data_dumps_directory, jobs=None):
+    # only parse what's new since the last run (make clean to start over)
+    manifest = {}
+    previous = []
+    previous_raw = {}
+    if os.path.isfile(MANIFEST) and os.path.isfile(RECEIPT_PARSED):
+        manifest = load_json(MANIFEST)
+        previous = load_transactions(RECEIPT_PARSED)
+        if os.path.isfile(RECEIPT_RAW):
+            previous_raw = load_json(RECEIPT_RAW)
+
+    parse_cache = use_parse_cache(PARSE_CACHE)
+    mail_filter = MailFilter()
+    # with jobs, the workers have already parsed the receipts, and send back the lines
+    receipt_raw = {}
+    transactions = traverse_files_recursive(
+        data_dumps_directory,
+        jobs=jobs,
+        manifest=manifest,
+        mail_filter=mail_filter,
+        receipt_raw=receipt_raw,
+    )
+    print(mail_filter.report(), end="")
     parse_date_raw(transactions)
     parse_body_html(transactions)
-    save_json("data/receipt_raw.json", transactions)
-    parse_receipt_raw(transactions)
-    save_json("data/receipt_parsed.json", transactions)
+    parse_receipt_raw(transactions, receipt_raw)
+    print(f"parse {len(transactions)} new messages")
+    print(f"parse cache: {parse_cache.hits} hits, {parse_cache.misses} misses")
+    transactions = merge_transactions(previous, transactions, manifest)
+    rollup = RollupCube.load(ROLLUP)
+    print(f"rollup: {rollup.sync(transactions)} new transactions")
+    rollup.save(ROLLUP)
+    save_transactions(RECEIPT_PARSED, transactions)
+    save_json(RECEIPT_RAW, merge_receipt_raw(previous_raw, receipt_raw, transactions))
+    save_json(MANIFEST, manifest)
 
     print(f"parse {len(transactions)} messages")
     warning_count = sum("skipped" in trans["receipt_data"] for trans in transactions)
@@ -24,19 +87,42 @@ def eml_to_stats(data_dumps_directory):
     warning_count = sum("warning" in trans for trans in transactions)
     if warning_count:
         print(f"still have {warning_count} messages with warnings")
+        for code, count in sorted(count_warnings(transactions).items()):
+            print(f"  {count} {code}")
 
-    agg = stats_sum_receipt_parsed(transactions)
+    if COLUMNAR:
+        columns = transform_receipt_parsed(
+            transactions, format=TransformFormat.Columnar
+        )
+        agg = stats_sum_columnar(columns, transactions)
+    else:
+        agg = stats_sum_receipt_parsed(transactions, cents=CENTS)
     # print(f"{json.dumps(agg, indent=2, default=datetime_serializer)}")
     print(f"\nFrom: {agg['date_min']}\n  To: {agg['date_max']}")
     print(stats_graph_agg(agg, half=True, log_base=1.5))
 
+    top_items = TopItems().add(transactions)
+    print(f"top items by spend (of {format_money(top_items.spend.total)})")
+    print(sketch_graph_top(top_items.spend, money=True))
+    print(f"top items by count (of {top_items.count.total})")
+    print(sketch_graph_top(top_items.count))
+
+    price_quantiles = stats_price_quantiles(transactions)
+    for name, q in [("median", 0.5), ("p95", 0.95)]:
+        print(f"{name} item price")
+        print(
+            stats_graph_agg(
+                stats_quantile_agg(price_quantiles, q), half=True, log_base=1.5
+            )
+        )
+
     # TODO parse date on reciept (store day time, day time 111 222 33 000000)
     # TODO TOTAL NUMBER OF ITEMS SOLD
 
     # XXX stats (numpy)
-    #  - make a datatable
+    #  - make a datatable (TransformFormat.Columnar)
     #  - collect total categories
-    #  - filter by date, sum categories
+    #  - filter by date, sum categories (DateRangeIndex, stats_sum_date_range)
     #  - graph? (for fun)
     # XXX stats (pandas)
     #  - venv
@@ -64,6 +150,46 @@ def load_json(filepath):
         return json.loads(file.read())
 
 
+def load_transactions(filepath):
+    """
+    load receipt_parsed.json, and convert the dates/decimals back
+    """
+    transactions = load_json(filepath)
+    for trans in transactions:
+        if "date" in trans:
+            trans["date"] = datetime.datetime.fromisoformat(trans["date"])
+            # saved before there was a date_epoch
+            trans.setdefault("date_epoch", int(trans["date"].timestamp()))
+        if "receipt_data" in trans:
+            receipt_data_deserializer(trans["receipt_data"], cents=CENTS)
+        if "warning" in trans:
+            # plain strings are the warnings from mail.py/html.py
+            trans["warning"] = [
+                ParseWarning.from_dict(warning, trans.get("id"))
+                if isinstance(warning, dict)
+                else warning
+                for warning in trans["warning"]
+            ]
+    if RECORDS:
+        transactions = [Transaction.from_dict(trans) for trans in transactions]
+    return transactions
+
+
+def save_transactions(filepath, transactions):
+    """
+    save receipt_parsed.json, with the money as Decimal (even when parsing in cents)
+    """
+    save_json(
+        filepath,
+        [
+            {**trans, "receipt_data": receipt_data_serializer(trans["receipt_data"])}
+            if "receipt_data" in trans
+            else trans
+            for trans in transactions
+        ],
+    )
+
+
 def save_json(filepath, data):
     print(f"saving {filepath}")
     with open(filepath, "w") as file:
@@ -72,4 +198,5 @@ def save_json(filepath, data):
 
 if __name__ == "__main__":
     data_dumps_directory = sys.argv[1]
-    eml_to_stats(data_dumps_directory)
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    eml_to_stats(data_dumps_directory, jobs=jobs)
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import time
+import unittest
+
+from app.parse import mail, receipt
+from app.parse.cache import ParseCache
+from app.parse.mail import traverse_files_recursive
+from app.parse.receipt import _parse_receipt_raw, use_parse_cache
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_get_put(self):
+        cache = ParseCache(self.tempdir.name, 1024)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"items": [1, 2, 3]})
+        self.assertEqual(cache.get("a"), {"items": [1, 2, 3]})
+        self.assertEqual(cache.counts(), {"hits": 1, "misses": 1})
+
+    def test_put_again(self):
+        cache = ParseCache(self.tempdir.name, 1024)
+        cache.put("a", "x" * 100)
+        size = cache.size
+        for _ in range(20):
+            cache.put("a", "x" * 100)
+        self.assertEqual(cache.size, size)
+        cache.put("a", "x" * 200)
+        self.assertEqual(cache.size, os.path.getsize(cache._path("a")))
+
+    def test_evict_least_recently_used(self):
+        cache = ParseCache(self.tempdir.name, 2500)
+        for key in ["a", "b"]:
+            cache.put(key, "x" * 1000)
+            # mtime has to be different
+            time.sleep(0.01)
+        # a was used more recently than b
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "x" * 1000)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertLessEqual(cache.size, 2500)
+        self.assertEqual(
+            sorted(os.listdir(self.tempdir.name)), ["a.pickle", "c.pickle"]
+        )
+
+
+class TestParseReceiptCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        with open(
+            "data/test_data/receipt_raw_sample.txt", "r", encoding="utf-8"
+        ) as file:
+            self.receipt_raw_sample = [
+                line.strip('"') for line in file.read().splitlines()
+            ]
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = use_parse_cache(self.tempdir.name)
+
+    def tearDown(self):
+        use_parse_cache(None)
+        self.tempdir.cleanup()
+
+    def test_hit(self):
+        expected = {"id": "a", "receipt_raw": list(self.receipt_raw_sample)}
+        _parse_receipt_raw(expected)
+        self.assertEqual(self.cache.counts(), {"hits": 0, "misses": 1})
+
+        trans = {"id": "b", "receipt_raw": list(self.receipt_raw_sample)}
+        _parse_receipt_raw(trans)
+        self.assertEqual(self.cache.counts(), {"hits": 1, "misses": 1})
+        self.assertEqual(trans["receipt_data"], expected["receipt_data"])
+        self.assertEqual(trans.get("warning", []), expected.get("warning", []))
+
+    def test_options(self):
+        _parse_receipt_raw({"id": "a", "receipt_raw": list(self.receipt_raw_sample)})
+        receipt.CENTS = True
+        try:
+            trans = {"id": "a", "receipt_raw": list(self.receipt_raw_sample)}
+            _parse_receipt_raw(trans)
+        finally:
+            receipt.CENTS = False
+        self.assertEqual(self.cache.counts(), {"hits": 0, "misses": 2})
+        self.assertIsInstance(trans["receipt_data"]["balance"], int)
+
+    def test_warning_trans_id(self):
+        lines = ["Store #00                             "]
+        _parse_receipt_raw({"id": "a", "receipt_raw": list(lines)})
+        trans = {"id": "b", "receipt_raw": list(lines)}
+        _parse_receipt_raw(trans)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual({warning.trans_id for warning in trans["warning"]}, {"b"})
+
+    def test_parallel(self):
+        # the eml and mbox are the same email, so that's 2 lookups each time
+        expected = traverse_files_recursive("data/test_data", jobs=2)
+        self.assertEqual(self.cache.hits + self.cache.misses, 2)
+        hits = self.cache.hits
+        transactions = traverse_files_recursive("data/test_data", jobs=2)
+        self.assertEqual(self.cache.hits, hits + 2)
+        self.assertEqual(transactions, expected)
+
+    def test_parallel_spawn(self):
+        mail.MP_START_METHOD = "spawn"
+        try:
+            traverse_files_recursive("data/test_data", jobs=2)
+            hits = self.cache.hits
+            traverse_files_recursive("data/test_data", jobs=2)
+        finally:
+            mail.MP_START_METHOD = None
+        self.assertEqual(self.cache.hits, hits + 2)
@@ -2,7 +2,12 @@ import datetime
 import json
 import unittest
 
-from app.parse.date import datetime_serializer, parse_date_raw
+from app.parse.date import (
+    datetime_serializer,
+    format_string,
+    parse_date,
+    parse_date_raw,
+)
 from app.parse.mail import parse_mbox_file
 
 
@@ -19,7 +24,15 @@ class TestParseReceipt(unittest.TestCase):
         for trans in self.transactions:
             self.assertEqual(
                 sorted(trans.keys()),
-                ["body_html", "date", "date_raw", "filename", "id", "idx"],
+                [
+                    "body_html",
+                    "date",
+                    "date_epoch",
+                    "date_raw",
+                    "filename",
+                    "id",
+                    "idx",
+                ],
                 f"bad keys for transaction {trans['id']}",
             )
 
@@ -27,7 +40,7 @@ class TestParseReceipt(unittest.TestCase):
         trans = self.one
         self.assertEqual(
             sorted(trans.keys()),
-            ["body_html", "date", "date_raw", "filename", "id", "idx"],
+            ["body_html", "date", "date_epoch", "date_raw", "filename", "id", "idx"],
         )
 
         date = trans["date"]
@@ -35,10 +48,55 @@ class TestParseReceipt(unittest.TestCase):
             date,
             datetime.datetime(2025, 4, 26, 15, 23, 14, tzinfo=datetime.timezone.utc),
         )
+        self.assertEqual(trans["date_epoch"], int(date.timestamp()))
 
         trans_cp = trans.copy()
         trans_cp.pop("body_html")
         self.assertEqual(
             json.dumps(trans_cp, default=datetime_serializer),
-            '{"filename": "data/dumps/Purchase-Groceries.mbox", "idx": 39, "date_raw": "Sat, 26 Apr 2025 15:23:14 +0000", "id": "Sat, 26 Apr 2025 15:23:14 +0000 @ data/dumps/Purchase-Groceries.mbox", "date": "2025-04-26T15:23:14+00:00"}',
+            '{"filename": "data/dumps/Purchase-Groceries.mbox", "idx": 39, "date_raw": "Sat, 26 Apr 2025 15:23:14 +0000", "id": "Sat, 26 Apr 2025 15:23:14 +0000 @ data/dumps/Purchase-Groceries.mbox", "date": "2025-04-26T15:23:14+00:00", "date_epoch": 1745680994}',
         )
+
+
+class TestParseDate(unittest.TestCase):
+    def test_fixed_layout(self):
+        for date_raw in [
+            "Sat, 26 Apr 2025 15:23:14 +0000",
+            "Sat, 5 Apr 2025 09:03:04 -0400",
+            "Mon, 31 Mar 2025 23:59:59 +0530",
+        ]:
+            expected = datetime.datetime.strptime(date_raw, format_string)
+            date, epoch = parse_date(date_raw)
+            self.assertEqual(date, expected, date_raw)
+            self.assertEqual(date.utcoffset(), expected.utcoffset(), date_raw)
+            self.assertEqual(epoch, int(expected.timestamp()), date_raw)
+
+    def test_fallback(self):
+        expected = datetime.datetime(
+            2025, 4, 26, 15, 23, 14, tzinfo=datetime.timezone.utc
+        )
+        for date_raw in [
+            "26 Apr 2025 15:23:14 +0000",
+            "Sat, 26 Apr 2025 15:23:14 GMT",
+            "Sat, 26 Apr 2025 15:23:14 +0000 (UTC)",
+            "Sat, 26 Apr 2025 11:23:14 -0400 (EDT)",
+            "Sat, 26 Apr 2025 15:23:14 -0000",
+        ]:
+            self.assertEqual(parse_date(date_raw), (expected, 1745680994), date_raw)
+
+    def test_errors(self):
+        transactions = [
+            {"date_raw": "Wed, 31 Apr 2025 15:23:14 +0000"},
+            {"date_raw": "not a date"},
+            {},
+        ]
+        parse_date_raw(transactions)
+        for trans in transactions:
+            self.assertNotIn("date", trans)
+            self.assertNotIn("date_epoch", trans)
+            self.assertEqual(len(trans["warning"]), 1)
+        self.assertEqual(transactions[2]["warning"], ["missing date"])
+
+    def test_memo(self):
+        date_raw = "Sat, 26 Apr 2025 15:23:14 +0000"
+        self.assertIs(parse_date(date_raw), parse_date(date_raw))
@@ -1,9 +1,17 @@
 import unittest
 
-from app.parse.html import parse_body_html
+from app.parse import html
+from app.parse.html import MyHTMLParser, extract_pre_fast, parse_body_html
 from app.parse.mail import parse_mbox_file
 
 
+def parse_pre_slow(body_html):
+    parser = MyHTMLParser()
+    parser.init()
+    parser.feed(body_html)
+    return parser.data
+
+
 class TestParseHtml(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -44,3 +52,60 @@ class TestParseHtml(unittest.TestCase):
 
         all_lens = set([len(line) for line in receipt_raw])
         self.assertEqual(all_lens, {38})
+
+
+class TestExtractPreFast(unittest.TestCase):
+    def test_same_as_parser(self):
+        for body_html in [
+            parse_mbox_file("data/test_data/test_simple.mbox")[0]["body_html"],
+            "<html><PRE class=receipt>one  <br>two &amp; 3&gt;<BR/></PRE>",
+            "<pre>one<b>two</b>three</pre><p>skip</p><pre>four</pre >",
+            "<p>a > b</p><pre>\r\none &#36;1.00\r\n</pre>",
+            "<p>no receipt</p>",
+        ]:
+            data = extract_pre_fast(body_html)
+            self.assertIsNotNone(data, body_html)
+            self.assertEqual(data, parse_pre_slow(body_html), body_html)
+
+    def test_ambiguous(self):
+        for body_html in [
+            "<!-- <pre> --><pre>one</pre>",
+            "<script>'<pre>'</script><pre>one</pre>",
+            "<pre>one<pre>two</pre>three</pre>",
+            "<pre>one",
+            "<pre/>one",
+            "<pre>a < b</pre>",
+            '<pre>one<span class="x">two</span></pre>',
+            '<pre title="a>b">one</pre>',
+            '<p title="<pre>">one</p><pre>two</pre>',
+        ]:
+            self.assertIsNone(extract_pre_fast(body_html), body_html)
+
+        # other tags that start with "pre" aren't a <pre>
+        for body_html in [
+            "<pre-x>one</pre-x><pre>two</pre>",
+            "<pre>one<pre-x>two</pre-x>three</pre>",
+            "<pre:foo>one</pre:foo>",
+        ]:
+            self.assertEqual(
+                extract_pre_fast(body_html), parse_pre_slow(body_html), body_html
+            )
+
+    def test_fallback(self):
+        transactions = [
+            {"id": "a", "body_html": "<pre>one</pre>"},
+            {"id": "b", "body_html": "<!-- x --><pre>one</pre>"},
+        ]
+        parse_body_html(transactions)
+        self.assertEqual(transactions[0]["receipt_raw"], ["one"])
+        self.assertEqual(transactions[1]["receipt_raw"], ["one"])
+
+    def test_check_fast_path(self):
+        html.CHECK_FAST_PATH = True
+        try:
+            transactions = parse_mbox_file("data/test_data/test_simple.mbox")
+            parse_body_html(transactions)
+        finally:
+            html.CHECK_FAST_PATH = False
+        self.assertNotIn("warning", transactions[0])
+        self.assertEqual(len(transactions[0]["receipt_raw"]), 53)
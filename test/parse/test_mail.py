@@ -1,6 +1,43 @@
+import json
+import mailbox
+import os
+import tempfile
+import types
 import unittest
+from email import policy
+from email.parser import BytesParser
 
-from app.parse.mail import parse_eml_file, parse_mbox_file
+from app.parse import mail, receipt
+from app.parse.html import parse_body_html
+from app.parse.mail import (
+    MBOX_INDEX_SUFFIX,
+    MailFilter,
+    count_mbox_messages,
+    fetch_mbox_message,
+    get_mbox_index,
+    get_transaction_from_bytes,
+    get_transaction_from_message,
+    iter_mbox_file,
+    iter_mbox_messages,
+    merge_receipt_raw,
+    merge_transactions,
+    parse_eml_file,
+    parse_mbox_file,
+    split_mbox_ranges,
+    traverse_files_recursive,
+)
+from app.parse.receipt import parse_receipt_raw, resolve_lines
+
+
+def write_mbox(mbox_file_path, times):
+    """
+    Build a bigger mbox out of test_simple.mbox, one copy per time (e.g. "15:23:14")
+    """
+    with open("data/test_data/test_simple.mbox", "rb") as file:
+        simple = file.read()
+    with open(mbox_file_path, "wb") as file:
+        for time in times:
+            file.write(simple.replace(b"15:23:14", time.encode()) + b"\n")
 
 
 class TestParseEmail(unittest.TestCase):
@@ -31,6 +68,15 @@ class TestParseEmail(unittest.TestCase):
         self.assertEqual(trans["idx"], 0)
         self.assertEqual(trans["date_raw"], "Wed, 08 Oct 2025 00:23:10 +0000")
 
+    def test_same_as_parse(self):
+        with open("data/test_data/test_simple.eml", "rb") as fp:
+            message = BytesParser(policy=policy.default).parse(fp)
+        expected = get_transaction_from_message(
+            message, "data/test_data/test_simple.eml", 0
+        )
+        self.assertEqual(self.transactions, [expected])
+        self.assertNotIn("\r", self.transactions[0]["body_html"])
+
 
 class TestParseMailbox(unittest.TestCase):
     @classmethod
@@ -59,3 +105,483 @@ class TestParseMailbox(unittest.TestCase):
         )
         self.assertEqual(trans["idx"], 0)
         self.assertEqual(trans["date_raw"], "Sat, 26 Apr 2025 15:23:14 +0000")
+
+
+class TestStreamMailbox(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mbox_file_path = os.path.join(self.tempdir.name, "multi.mbox")
+        write_mbox(self.mbox_file_path, ["15:23:14", "16:23:14", "17:23:14"])
+
+    @classmethod
+    def tearDownClass(self):
+        self.tempdir.cleanup()
+
+    def test_generator(self):
+        transactions = iter_mbox_file(self.mbox_file_path)
+        self.assertIsInstance(transactions, types.GeneratorType)
+        trans = next(transactions)
+        self.assertEqual(trans["idx"], 0)
+        self.assertEqual(trans["date_raw"], "Sat, 26 Apr 2025 15:23:14 +0000")
+
+    def test_same_as_mailbox(self):
+        expected = [
+            get_transaction_from_message(message, self.mbox_file_path, i)
+            for i, message in enumerate(mailbox.mbox(self.mbox_file_path))
+        ]
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(parse_mbox_file(self.mbox_file_path), expected)
+
+    def test_traverse_dedup(self):
+        write_mbox(
+            os.path.join(self.tempdir.name, "dupes.mbox"), ["16:23:14", "18:23:14"]
+        )
+        transactions = traverse_files_recursive(self.tempdir.name)
+        self.assertEqual(
+            sorted(trans["date_raw"] for trans in transactions),
+            [
+                "Sat, 26 Apr 2025 15:23:14 +0000",
+                "Sat, 26 Apr 2025 16:23:14 +0000",
+                "Sat, 26 Apr 2025 17:23:14 +0000",
+                "Sat, 26 Apr 2025 18:23:14 +0000",
+            ],
+        )
+        [uniq] = [trans for trans in transactions if "duplicates" in trans]
+        self.assertEqual(len(uniq["duplicates"]), 2)
+
+    def test_known_headers_only(self):
+        known = {"Sat, 26 Apr 2025 16:23:14 +0000"}
+        transactions = list(iter_mbox_file(self.mbox_file_path, known=known))
+        self.assertEqual(
+            [sorted(trans.keys()) for trans in transactions],
+            [
+                ["body_html", "date_raw", "filename", "id", "idx"],
+                ["date_raw", "filename", "id", "idx"],
+                ["body_html", "date_raw", "filename", "id", "idx"],
+            ],
+        )
+
+    def test_headers_first(self):
+        with open(self.mbox_file_path, "rb") as fp:
+            [_, _, message_bytes] = next(iter_mbox_messages(fp))
+        # the body is never looked at for a known message
+        headers, _, _ = message_bytes.partition(b"\r\n\r\n")
+        message_bytes = headers + b"\r\n\r\n" + b"\xff" * 100
+        trans = get_transaction_from_bytes(
+            message_bytes,
+            self.mbox_file_path,
+            0,
+            known={"Sat, 26 Apr 2025 15:23:14 +0000"},
+        )
+        self.assertEqual(
+            trans,
+            {
+                "filename": self.mbox_file_path,
+                "idx": 0,
+                "date_raw": "Sat, 26 Apr 2025 15:23:14 +0000",
+                "id": f"Sat, 26 Apr 2025 15:23:14 +0000 @ {self.mbox_file_path}",
+            },
+        )
+
+
+class TestTraverseParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        write_mbox(os.path.join(self.tempdir.name, "a.mbox"), ["15:23:14", "16:23:14"])
+        write_mbox(os.path.join(self.tempdir.name, "b.mbox"), ["16:23:14", "17:23:14"])
+        with open("data/test_data/test_simple.eml", "rb") as src:
+            with open(os.path.join(self.tempdir.name, "c.eml"), "wb") as dst:
+                dst.write(src.read())
+
+    @classmethod
+    def tearDownClass(self):
+        self.tempdir.cleanup()
+
+    def test_same_as_sequential(self):
+        expected = traverse_files_recursive(self.tempdir.name)
+        parse_body_html(expected)
+        parse_receipt_raw(expected)
+        self.assertEqual(len(expected), 4)
+
+        transactions = traverse_files_recursive(self.tempdir.name, jobs=2)
+        self.assertEqual(transactions, expected)
+        self.assertIn("receipt_data", transactions[0])
+
+    def test_receipt_raw(self):
+        expected = {}
+        transactions = traverse_files_recursive(self.tempdir.name)
+        parse_body_html(transactions)
+        parse_receipt_raw(transactions, expected)
+        self.assertEqual(len(expected), 4)
+
+        receipt_raw = {}
+        transactions = traverse_files_recursive(
+            self.tempdir.name, jobs=2, receipt_raw=receipt_raw
+        )
+        self.assertEqual(receipt_raw, expected)
+        self.assertNotIn("receipt_raw", transactions[0])
+
+    def test_resolve_lines(self):
+        expected = traverse_files_recursive(self.tempdir.name)
+        parse_body_html(expected)
+        parse_receipt_raw(expected)
+
+        receipt.LINES = "offsets"
+        try:
+            receipt_raw = {}
+            transactions = traverse_files_recursive(
+                self.tempdir.name, jobs=2, receipt_raw=receipt_raw
+            )
+        finally:
+            receipt.LINES = "keep"
+        for trans, expected_trans in zip(transactions, expected):
+            items = trans["receipt_data"]["items"]
+            self.assertIsInstance(items[0]["lines"][0], int)
+            self.assertEqual(
+                [resolve_lines(item, receipt_raw[trans["id"]]) for item in items],
+                [item["lines"] for item in expected_trans["receipt_data"]["items"]],
+            )
+
+
+class TestSplitMailbox(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mbox_file_path = os.path.join(self.tempdir.name, "big.mbox")
+        write_mbox(
+            self.mbox_file_path,
+            ["15:23:14", "16:23:14", "17:23:14", "18:23:14", "19:23:14"],
+        )
+
+    @classmethod
+    def tearDownClass(self):
+        self.tempdir.cleanup()
+
+    def test_ranges(self):
+        ranges = split_mbox_ranges(self.mbox_file_path, 3)
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.mbox_file_path))
+        with open(self.mbox_file_path, "rb") as file:
+            data = file.read()
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(stop, start)
+            self.assertTrue(data[start:].startswith(b"From "))
+
+    def test_more_ranges_than_messages(self):
+        ranges = split_mbox_ranges(self.mbox_file_path, 20)
+        self.assertLessEqual(len(ranges), 5)
+
+    def test_same_as_sequential(self):
+        expected = parse_mbox_file(self.mbox_file_path)
+        parse_body_html(expected)
+        parse_receipt_raw(expected)
+
+        transactions = parse_mbox_file(self.mbox_file_path, jobs=3)
+        self.assertEqual([trans["idx"] for trans in transactions], [0, 1, 2, 3, 4])
+        self.assertEqual(transactions, expected)
+
+
+class TestMailboxIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mbox_file_path = os.path.join(self.tempdir.name, "indexed.mbox")
+        write_mbox(self.mbox_file_path, ["15:23:14", "16:23:14", "17:23:14"])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_index(self):
+        index = get_mbox_index(self.mbox_file_path)
+        self.assertTrue(os.path.isfile(self.mbox_file_path + MBOX_INDEX_SUFFIX))
+        self.assertEqual(index["size"], os.path.getsize(self.mbox_file_path))
+        self.assertEqual(len(index["messages"]), 3)
+        offset, length, date_raw = index["messages"][1]
+        self.assertEqual(date_raw, "Sat, 26 Apr 2025 16:23:14 +0000")
+        with open(self.mbox_file_path, "rb") as file:
+            file.seek(offset)
+            self.assertTrue(file.read(length).startswith(b"From "))
+
+    def test_index_reused(self):
+        get_mbox_index(self.mbox_file_path)
+        # tamper with the saved index, it should be trusted while the mbox is unchanged
+        with open(self.mbox_file_path + MBOX_INDEX_SUFFIX, "r") as file:
+            index = json.loads(file.read())
+        index["messages"] = index["messages"][:1]
+        with open(self.mbox_file_path + MBOX_INDEX_SUFFIX, "w") as file:
+            file.write(json.dumps(index))
+        self.assertEqual(len(get_mbox_index(self.mbox_file_path)["messages"]), 1)
+
+    def test_index_rebuilt(self):
+        get_mbox_index(self.mbox_file_path)
+        write_mbox(self.mbox_file_path, ["15:23:14", "16:23:14"])
+        self.assertEqual(len(get_mbox_index(self.mbox_file_path)["messages"]), 2)
+
+    def test_fetch(self):
+        transactions = parse_mbox_file(self.mbox_file_path)
+        for idx in [2, 0, 1]:
+            self.assertEqual(
+                fetch_mbox_message(self.mbox_file_path, idx), transactions[idx]
+            )
+        self.assertEqual(parse_mbox_file(self.mbox_file_path, idx=1), [transactions[1]])
+
+
+class TestMailFilter(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mbox_file_path = os.path.join(self.tempdir.name, "a.mbox")
+        write_mbox(self.mbox_file_path, ["15:23:14", "16:23:14", "17:23:14"])
+        with open(self.mbox_file_path, "rb") as file:
+            messages = file.read().split(b"\nFrom ")
+        # a newsletter from a mailing list, and a receipt with an encoded subject
+        messages[1] = messages[1].replace(
+            b"Subject: here be your e-receipt",
+            b"Subject: this week's deals\r\nList-Id: <weekly-ad.fake.it.com>",
+        )
+        messages[2] = messages[2].replace(
+            b"Subject: here be your e-receipt",
+            b"Subject: =?utf-8?q?here_be_your_e-receipt?=",
+        )
+        with open(self.mbox_file_path, "wb") as file:
+            file.write(b"\nFrom ".join(messages))
+
+    @classmethod
+    def tearDownClass(self):
+        self.tempdir.cleanup()
+
+    def test_keep_everything(self):
+        mail_filter = MailFilter()
+        transactions = parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter)
+        self.assertEqual(len(transactions), 3)
+        self.assertEqual(mail_filter.skipped, {"sender": 0, "subject": 0, "list_id": 0})
+        self.assertEqual(mail_filter.report(), "")
+
+    def test_sender(self):
+        mail_filter = MailFilter(senders=["No-Reply@fake.it.com"])
+        self.assertEqual(
+            len(parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter)), 3
+        )
+        mail_filter = MailFilter(senders=["someone@else.com"])
+        self.assertEqual(
+            parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter), []
+        )
+        self.assertEqual(mail_filter.skipped["sender"], 3)
+        self.assertEqual(mail_filter.report(), "skipped 3 emails (sender)\n")
+
+    def test_subject(self):
+        mail_filter = MailFilter(subject=r"e-receipt")
+        transactions = parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter)
+        # idx still counts the emails that were skipped
+        self.assertEqual([trans["idx"] for trans in transactions], [0, 2])
+        self.assertEqual(mail_filter.skipped["subject"], 1)
+
+    def test_list_id(self):
+        mail_filter = MailFilter(list_ids=["weekly-ad.fake.it.com"])
+        transactions = parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter)
+        self.assertEqual([trans["idx"] for trans in transactions], [0, 2])
+        self.assertEqual(mail_filter.skipped["list_id"], 1)
+
+    def test_module_defaults(self):
+        mail.MAIL_FILTER_SUBJECT = r"e-receipt"
+        try:
+            mail_filter = MailFilter()
+        finally:
+            mail.MAIL_FILTER_SUBJECT = None
+        parse_mbox_file(self.mbox_file_path, mail_filter=mail_filter)
+        self.assertEqual(mail_filter.skipped["subject"], 1)
+        self.assertIsNone(MailFilter().subject)
+
+    def test_skipped_before_decode(self):
+        message = get_transaction_from_bytes(
+            b"From: someone@else.com\r\n\r\nnot a receipt",
+            "a.eml",
+            0,
+            mail_filter=MailFilter(senders=["no-reply@fake.it.com"]),
+        )
+        self.assertIsNone(message)
+
+    def test_bad_encoded_subject(self):
+        mail_filter = MailFilter(subject=r"e-receipt")
+        for subject in [b"=?x-bogus?Q?hi?=", b"=?utf-8?q?\xff?="]:
+            message = get_transaction_from_bytes(
+                b"From: no-reply@fake.it.com\r\nSubject: "
+                + subject
+                + b"\r\n\r\nnot a receipt",
+                "a.eml",
+                0,
+                mail_filter=mail_filter,
+            )
+            self.assertIsNone(message)
+        self.assertEqual(mail_filter.skipped["subject"], 2)
+
+    def test_parallel(self):
+        expected_filter = MailFilter(list_ids=["weekly-ad.fake.it.com"])
+        expected = traverse_files_recursive(
+            self.tempdir.name, mail_filter=expected_filter
+        )
+        parse_body_html(expected)
+        parse_receipt_raw(expected)
+
+        mail_filter = MailFilter(list_ids=["weekly-ad.fake.it.com"])
+        transactions = traverse_files_recursive(
+            self.tempdir.name, jobs=2, mail_filter=mail_filter
+        )
+        self.assertEqual(transactions, expected)
+        self.assertEqual(mail_filter.skipped, expected_filter.skipped)
+
+    def test_count_mbox_messages(self):
+        self.assertEqual(count_mbox_messages(self.mbox_file_path), 3)
+        ranges = split_mbox_ranges(self.mbox_file_path, 3)
+        self.assertEqual(
+            sum(count_mbox_messages(self.mbox_file_path, *r) for r in ranges), 3
+        )
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mbox_file_path = os.path.join(self.tempdir.name, "a.mbox")
+        write_mbox(self.mbox_file_path, ["15:23:14", "16:23:14"])
+        self.eml_file_path = os.path.join(self.tempdir.name, "b.eml")
+        with open("data/test_data/test_simple.eml", "rb") as src:
+            with open(self.eml_file_path, "wb") as dst:
+                dst.write(src.read())
+        self.manifest = {}
+        self.previous = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_first_run(self):
+        self.assertEqual(len(self.previous), 3)
+        self.assertEqual(
+            sorted(self.manifest.keys()), [self.mbox_file_path, self.eml_file_path]
+        )
+        entry = self.manifest[self.mbox_file_path]
+        self.assertEqual(entry["count"], 2)
+        self.assertEqual(entry["offset"], os.path.getsize(self.mbox_file_path))
+
+    def test_unchanged(self):
+        transactions = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+        self.assertEqual(transactions, [])
+        self.assertEqual(
+            merge_transactions(self.previous, transactions, self.manifest),
+            self.previous,
+        )
+
+    def test_appended(self):
+        with open(self.mbox_file_path, "rb") as file:
+            simple = file.read().split(b"\nFrom ")[0] + b"\n"
+        with open(self.mbox_file_path, "ab") as file:
+            file.write(simple.replace(b"15:23:14", b"17:23:14"))
+
+        transactions = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0]["idx"], 2)
+        self.assertEqual(self.manifest[self.mbox_file_path]["count"], 3)
+
+        merged = merge_transactions(self.previous, transactions, self.manifest)
+        self.assertEqual(len(merged), 4)
+        self.assertEqual(
+            sorted(merged, key=lambda trans: trans["id"]),
+            sorted(
+                traverse_files_recursive(self.tempdir.name),
+                key=lambda trans: trans["id"],
+            ),
+        )
+
+    def test_appended_parallel(self):
+        with open(self.mbox_file_path, "rb") as file:
+            simple = file.read().split(b"\nFrom ")[0] + b"\n"
+        with open(self.mbox_file_path, "ab") as file:
+            file.write(simple.replace(b"15:23:14", b"17:23:14"))
+            file.write(simple.replace(b"15:23:14", b"18:23:14"))
+
+        transactions = traverse_files_recursive(
+            self.tempdir.name, jobs=2, manifest=self.manifest
+        )
+        self.assertEqual([trans["idx"] for trans in transactions], [2, 3])
+        self.assertEqual(self.manifest[self.mbox_file_path]["count"], 4)
+
+    def test_rewritten(self):
+        write_mbox(self.mbox_file_path, ["18:23:14"])
+        transactions = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0]["idx"], 0)
+
+        merged = merge_transactions(self.previous, transactions, self.manifest)
+        self.assertEqual(
+            sorted(trans["id"] for trans in merged),
+            sorted(
+                trans["id"] for trans in traverse_files_recursive(self.tempdir.name)
+            ),
+        )
+
+    def test_removed(self):
+        os.remove(self.eml_file_path)
+        transactions = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+        self.assertEqual(transactions, [])
+        self.assertNotIn(self.eml_file_path, self.manifest)
+        merged = merge_transactions(self.previous, transactions, self.manifest)
+        self.assertEqual(len(merged), 2)
+
+    def test_appended_filtered(self):
+        with open(self.mbox_file_path, "rb") as file:
+            simple = file.read().split(b"\nFrom ")[0] + b"\n"
+        with open(self.mbox_file_path, "ab") as file:
+            file.write(simple.replace(b"15:23:14", b"17:23:14"))
+
+        # the manifest counts every email, even when the filter skipped the last one
+        self.manifest = {}
+        traverse_files_recursive(
+            self.tempdir.name,
+            manifest=self.manifest,
+            mail_filter=MailFilter(senders=["someone@else.com"]),
+        )
+        self.assertEqual(self.manifest[self.mbox_file_path]["count"], 3)
+
+    def test_receipt_raw(self):
+        previous_raw = {}
+        parse_body_html(self.previous)
+        parse_receipt_raw(self.previous, previous_raw)
+        self.assertEqual(len(previous_raw), 3)
+
+        os.remove(self.eml_file_path)
+        with open(self.mbox_file_path, "rb") as file:
+            simple = file.read().split(b"\nFrom ")[0] + b"\n"
+        with open(self.mbox_file_path, "ab") as file:
+            file.write(simple.replace(b"15:23:14", b"17:23:14"))
+        receipt_raw = {}
+        transactions = traverse_files_recursive(
+            self.tempdir.name, manifest=self.manifest
+        )
+        parse_body_html(transactions)
+        parse_receipt_raw(transactions, receipt_raw)
+        self.assertEqual(len(receipt_raw), 1)
+
+        merged = merge_transactions(self.previous, transactions, self.manifest)
+        expected = {}
+        expected_transactions = traverse_files_recursive(self.tempdir.name)
+        parse_body_html(expected_transactions)
+        parse_receipt_raw(expected_transactions, expected)
+        self.assertEqual(merge_receipt_raw(previous_raw, receipt_raw, merged), expected)
+
+        # older runs saved the transactions
+        old_format = [
+            {"id": trans_id, "receipt_raw": lines}
+            for trans_id, lines in previous_raw.items()
+        ]
+        self.assertEqual(merge_receipt_raw(old_format, receipt_raw, merged), expected)
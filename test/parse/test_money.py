@@ -0,0 +1,32 @@
+import unittest
+from decimal import Decimal
+
+from app.parse.money import cents_to_decimal, format_money, round_up_div, to_cents
+
+
+class TestMoney(unittest.TestCase):
+    def test_to_cents(self):
+        self.assertEqual(to_cents("12.34"), 1234)
+        self.assertEqual(to_cents("0.05"), 5)
+        self.assertEqual(to_cents("0"), 0)
+        self.assertEqual(to_cents("3.5"), 350)
+        self.assertEqual(to_cents("-1.50"), -150)
+        self.assertEqual(to_cents(Decimal("18.22")), 1822)
+        with self.assertRaises(ValueError):
+            to_cents("1.005")
+
+    def test_cents_to_decimal(self):
+        self.assertEqual(cents_to_decimal(1234), Decimal("12.34"))
+        self.assertEqual(str(cents_to_decimal(5)), "0.05")
+        self.assertEqual(str(cents_to_decimal(-150)), "-1.50")
+        self.assertEqual(cents_to_decimal(0), Decimal("0"))
+
+    def test_format_money(self):
+        self.assertEqual(format_money(1822), "18.22")
+        self.assertEqual(format_money(Decimal("18.22")), "18.22")
+
+    def test_round_up_div(self):
+        self.assertEqual(round_up_div(600, 100), 6)
+        self.assertEqual(round_up_div(601, 100), 7)
+        self.assertEqual(round_up_div(-601, 100), -7)
+        self.assertEqual(round_up_div(0, 100), 0)
@@ -2,10 +2,23 @@ import json
 import unittest
 from decimal import Decimal
 
+from app.parse import receipt
 from app.parse.date import datetime_serializer
 from app.parse.html import parse_body_html
 from app.parse.mail import parse_mbox_file
-from app.parse.receipt import ReceiptParser, _parse_receipt_raw, parse_receipt_raw
+from app.parse.receipt import (
+    APPLY_TAX_RATE,
+    APPLY_TAX_RATE_CENTS,
+    ReceiptParser,
+    _parse_receipt_raw,
+    classify_line,
+    parse_line,
+    parse_receipt_raw,
+    receipt_data_deserializer,
+    receipt_data_serializer,
+    resolve_lines,
+    scan_receipt,
+)
 
 
 class TestParseReceipt(unittest.TestCase):
@@ -438,6 +451,31 @@ class TestParseReceiptUnits(unittest.TestCase):
         self.assertEqual(parser.warning, [])
         self.assertNotIn("skipped", parser.data)
 
+    def test_warning_money_cents(self):
+        receipt_raw = [
+            "Store #00      04/07/25      06:16pm ",
+            "PRODUCE                               ",
+            " 4 @ 0.79                             ",
+            "        KIWI                    3.17 F",
+            "        TAX                     0.47  ",
+            "        TAX                     0.48  ",
+            "   **** BALANCE               111.41  ",
+            "   **** BALANCE               111.42  ",
+        ]
+        expected = ReceiptParser()
+        expected.feed(receipt_raw)
+        parser = ReceiptParser(cents=True)
+        parser.feed(receipt_raw)
+        self.assertEqual(
+            [warning.code for warning in parser.warning],
+            ["quantity_mismatch", "duplicate_tax", "duplicate_balance"],
+        )
+        self.assertEqual(
+            parser.warning[0].args["adjustment"]["amount"], Decimal("3.17")
+        )
+        self.assertEqual(parser.warning[1:], expected.warning[1:])
+        self.assertEqual(str(parser.warning[1]), "duplicate tax? old: 0.47, new: 0.48")
+
     def test_item_bags(self):
         parser = ReceiptParser()
         parser.feed(
@@ -510,6 +548,78 @@ class TestParseReceiptUnits(unittest.TestCase):
         )
 
 
+class TestClassifyLine(unittest.TestCase):
+    def test_kinds(self):
+        for line, expected in [
+            ("                                      ", ("blank", ())),
+            ("Store #155      04/26/25      11:22am ", ("store", ("155",))),
+            ("**************************************", ("stars", ())),
+            ("PRODUCE                               ", ("category", ("PRODUCE",))),
+            ("Payment Type:                         ", ("text", ())),
+            ("        TAX                     0.00  ", ("tax", ("0.00",))),
+            ("   **** BALANCE                18.22  ", ("balance", ("18.22",))),
+            (
+                "        BONUS BUY SAVINGS       1.00-F",
+                ("savings", ("BONUS BUY SAVINGS", "BONUS BUY ", "1.00", "-F")),
+            ),
+            (
+                "        PRESCRIPTION           18.22 Q",
+                ("item", ("  ", "PRESCRIPTION        ", "18.22", " Q")),
+            ),
+            (
+                "WT      BANANAS                 0.59 F",
+                ("item", ("WT", "BANANAS             ", "0.59", " F")),
+            ),
+            (
+                "SC      GIANT COUPON            1.00-F",
+                ("credit", ("SC", "GIANT COUPON        ", "1.00", "-F")),
+            ),
+            ("SC      $3 OFF WYB3             3.00-T", ("coupon", ())),
+            (
+                "   PRICE YOU PAY           FREE       ",
+                ("verify", ("PRICE YOU PAY", "FREE")),
+            ),
+            (
+                "   PRICE YOU PAY FOR 2     5.00       ",
+                ("verify_for", ("PRICE YOU PAY FOR", "2", "5.00")),
+            ),
+            (
+                " 2.13 lb @ 0.59 /lb = 1.26            ",
+                ("weight", ("2.13 lb @ 0.59 /lb", " = 1.26", "1.26")),
+            ),
+            (
+                " 1.5 lb @ 0.59 /lb                    ",
+                ("weight", ("1.5 lb @ 0.59 /lb", None, None)),
+            ),
+            (" 2 @ 1.00                             ", ("quantity", ("2 @ 1.00",))),
+            ("   Store Telephone:  (410) 995-6893   ", ("other", ())),
+            ("WT      ???                           ", ("other", ())),
+        ]:
+            self.assertEqual(classify_line(line), expected, line)
+
+    def test_parse_line(self):
+        for line, amount, cents in [
+            ("        TAX                     0.06  ", Decimal("0.06"), 6),
+            ("   PRICE YOU PAY           FREE       ", Decimal("0"), 0),
+            ("   PRICE YOU PAY FOR 2     5.00       ", Decimal("5.00"), 500),
+            (" 2.13 lb @ 0.59 /lb = 1.26            ", Decimal("1.26"), 126),
+            (" 1.5 lb @ 0.59 /lb                    ", None, None),
+            (" 3 @ 1.25                             ", Decimal("3.75"), 375),
+            (" 3 @ 1.2                              ", None, None),
+            ("PRODUCE                               ", None, None),
+        ]:
+            kind, groups = classify_line(line)
+            self.assertEqual(parse_line(line), (kind, groups, amount), line)
+            self.assertEqual(parse_line(line, True), (kind, groups, cents), line)
+
+    def test_parse_line_memo(self):
+        line = "WT      BANANAS                 0.59 F"
+        parse_line(line)
+        hits = parse_line.cache_info().hits
+        self.assertIs(parse_line(line), parse_line(line))
+        self.assertEqual(parse_line.cache_info().hits, hits + 2)
+
+
 class TestParseReceiptRawSample(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -1060,11 +1170,101 @@ class TestParseReceiptRawSample(unittest.TestCase):
         # we should have verified them all
         self.assertEqual(len(items), 0)
 
-        if trans.get("warning", []) and "(skipped)" in ".".join(trans.get("warning")):
+        if trans.get("warning", []) and "(skipped)" in ".".join(
+            map(str, trans.get("warning"))
+        ):
             print(f"{json.dumps(trans['receipt_data'].get('skipped'), indent=2)}")
         self.assertEqual(trans.get("warning", []), [])
         self.assertEqual(trans["receipt_data"].get("skipped", []), [])
 
+    def test_receipt_data_deserializer(self):
+        trans = {"id": "receipt_raw_sample", "receipt_raw": self.receipt_raw_sample}
+        _parse_receipt_raw(trans)
+        receipt_data = json.loads(
+            json.dumps(trans["receipt_data"], default=datetime_serializer)
+        )
+        self.assertNotEqual(receipt_data, trans["receipt_data"])
+        self.assertEqual(receipt_data_deserializer(receipt_data), trans["receipt_data"])
+
+    def test_receipt_raw_sample_cents(self):
+        expected = {"id": "receipt_raw_sample", "receipt_raw": self.receipt_raw_sample}
+        _parse_receipt_raw(expected)
+        trans = {"id": "receipt_raw_sample", "receipt_raw": self.receipt_raw_sample}
+        receipt.CENTS = True
+        try:
+            _parse_receipt_raw(trans)
+        finally:
+            receipt.CENTS = False
+
+        self.assertEqual(trans["receipt_data"]["balance"], 11141)
+        self.assertIsInstance(trans["receipt_data"]["items"][0]["price"], int)
+        self.assertEqual(trans.get("warning", []), expected.get("warning", []))
+        self.assertEqual(
+            receipt_data_serializer(trans["receipt_data"]), expected["receipt_data"]
+        )
+
+        receipt_data = json.loads(
+            json.dumps(
+                receipt_data_serializer(trans["receipt_data"]),
+                default=datetime_serializer,
+            )
+        )
+        self.assertEqual(
+            receipt_data_deserializer(receipt_data, cents=True), trans["receipt_data"]
+        )
+
+    def test_receipt_raw_sample_lines(self):
+        expected = {"id": "receipt_raw_sample", "receipt_raw": self.receipt_raw_sample}
+        _parse_receipt_raw(expected)
+        expected_items = expected["receipt_data"]["items"]
+
+        parser = ReceiptParser(lines="offsets")
+        parser.feed(self.receipt_raw_sample)
+        items = parser.data["items"]
+        self.assertIsInstance(items[0]["lines"][0], int)
+        self.assertEqual(
+            [resolve_lines(item, self.receipt_raw_sample) for item in items],
+            [item["lines"] for item in expected_items],
+        )
+
+        parser = ReceiptParser(lines="drop")
+        parser.feed(self.receipt_raw_sample)
+        items = parser.data["items"]
+        self.assertNotIn("lines", items[0])
+        self.assertEqual(resolve_lines(items[0], self.receipt_raw_sample), [])
+        self.assertEqual(
+            items,
+            [
+                {key: value for key, value in item.items() if key != "lines"}
+                for item in expected_items
+            ],
+        )
+
+    def test_receipt_raw_sample_scan(self):
+        self.assertEqual(
+            scan_receipt(self.receipt_raw_sample),
+            [(line, *parse_line(line)) for line in self.receipt_raw_sample],
+        )
+        self.assertEqual(scan_receipt([]), [])
+        self.assertEqual(scan_receipt([""]), [("", "text", (), None)])
+        self.assertIsNone(scan_receipt(["PRODUCE\n  "]))
+
+        for options in [{}, {"cents": True}, {"lines": "offsets"}]:
+            expected = ReceiptParser(**options)
+            expected.feed(self.receipt_raw_sample)
+            parser = ReceiptParser(engine="scan", **options)
+            parser.feed(self.receipt_raw_sample)
+            self.assertEqual(parser.data, expected.data, options)
+            self.assertEqual(parser.warning, expected.warning, options)
+
+    def test_apply_tax_rate_cents(self):
+        for cents in [0, 1, 8, 9, 17, 1234, 5000, -9, -1234]:
+            self.assertEqual(
+                APPLY_TAX_RATE_CENTS(cents),
+                int(APPLY_TAX_RATE(Decimal(cents).scaleb(-2)).scaleb(2)),
+                cents,
+            )
+
 
 class TestParseReceiptRawStoreCoupon(unittest.TestCase):
     @classmethod
@@ -1152,7 +1352,9 @@ class TestParseReceiptRawStoreCoupon(unittest.TestCase):
             json.dumps(item, default=datetime_serializer, indent=2),
         )
 
-        if trans.get("warning", []) and "(skipped)" in ".".join(trans.get("warning")):
+        if trans.get("warning", []) and "(skipped)" in ".".join(
+            map(str, trans.get("warning"))
+        ):
             print(f"{json.dumps(trans['receipt_data'].get('skipped'), indent=2)}")
         self.assertEqual(trans.get("warning", []), [])
         self.assertEqual(trans["receipt_data"].get("skipped", []), [])
@@ -0,0 +1,145 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from decimal import Decimal
+
+from app.parse import mail
+from app.parse.date import datetime_serializer
+from app.parse.html import parse_body_html
+from app.parse.mail import parse_mbox_file, traverse_files_recursive
+from app.parse.receipt import _parse_receipt_raw, parse_receipt_raw
+from app.parse.records import Adjustment, Item, Transaction
+from app.parse.transform import TransformFormat, transform_receipt_parsed
+from app.process.stats import stats_sum_receipt_parsed
+
+
+class TestRecords(unittest.TestCase):
+    def test_mapping(self):
+        item = Item(name="BANANAS", price=Decimal("0.59"))
+        self.assertFalse(hasattr(item, "__dict__"))
+        self.assertEqual(item["name"], "BANANAS")
+        self.assertIn("price", item)
+        self.assertNotIn("category", item)
+        self.assertIsNone(item.get("category"))
+        self.assertEqual(item.setdefault("lines", []), [])
+        item["lines"].append("WT      BANANAS                 0.59 F")
+        self.assertEqual(sorted(item.keys()), ["lines", "name", "price"])
+        self.assertEqual(item.pop("lines"), ["WT      BANANAS                 0.59 F"])
+        self.assertEqual(item.pop("lines", None), None)
+        with self.assertRaises(KeyError):
+            item["category"]
+        with self.assertRaises(KeyError):
+            item["not_a_field"] = 1
+        self.assertEqual(item, {"name": "BANANAS", "price": Decimal("0.59")})
+        self.assertEqual({**item}, {"name": "BANANAS", "price": Decimal("0.59")})
+
+    def test_dict_round_trip(self):
+        data = {
+            "id": "a",
+            "receipt_data": {
+                "store_number": 155,
+                "items": [
+                    {
+                        "name": "BANANAS",
+                        "price": Decimal("0.59"),
+                        "adjustments": [{"name": "BANANAS", "amount": Decimal("0.59")}],
+                    }
+                ],
+            },
+        }
+        trans = Transaction.from_dict(data)
+        self.assertIsInstance(trans["receipt_data"]["items"][0], Item)
+        self.assertIsInstance(
+            trans["receipt_data"]["items"][0]["adjustments"][0], Adjustment
+        )
+        self.assertEqual(trans.to_dict(), data)
+        self.assertIs(type(trans.to_dict()["receipt_data"]["items"][0]), dict)
+        self.assertEqual(pickle.loads(pickle.dumps(trans)), data)
+        self.assertEqual(
+            json.loads(json.dumps(trans, default=datetime_serializer)),
+            json.loads(json.dumps(data, default=datetime_serializer)),
+        )
+
+
+class TestRecordsPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        with open(
+            "data/test_data/receipt_raw_sample.txt", "r", encoding="utf-8"
+        ) as file:
+            self.receipt_raw_sample = [
+                line.strip('"') for line in file.read().splitlines()
+            ]
+
+    def test_receipt_parser(self):
+        expected = {"id": "receipt_raw_sample", "receipt_raw": self.receipt_raw_sample}
+        _parse_receipt_raw(expected)
+        trans = Transaction(
+            id="receipt_raw_sample", receipt_raw=self.receipt_raw_sample
+        )
+        _parse_receipt_raw(trans)
+
+        items = trans["receipt_data"]["items"]
+        self.assertIsInstance(items[0], Item)
+        self.assertIsInstance(items[0]["adjustments"][0], Adjustment)
+        self.assertEqual(trans, expected)
+
+    def test_stats_and_transform(self):
+        trans = Transaction(
+            id="receipt_raw_sample",
+            date="2025-06-16",
+            receipt_raw=self.receipt_raw_sample,
+        )
+        parse_receipt_raw([trans])
+        expected = trans.to_dict()
+        self.assertEqual(
+            stats_sum_receipt_parsed([trans]), stats_sum_receipt_parsed([expected])
+        )
+        self.assertEqual(
+            transform_receipt_parsed([trans], format=TransformFormat.Table),
+            transform_receipt_parsed([expected], format=TransformFormat.Table),
+        )
+
+    def test_mail(self):
+        expected = parse_mbox_file("data/test_data/test_simple.mbox")
+        mail.RECORDS = True
+        try:
+            transactions = parse_mbox_file("data/test_data/test_simple.mbox")
+            parallel = traverse_files_recursive("data/test_data", jobs=2)
+        finally:
+            mail.RECORDS = False
+        self.assertIsInstance(transactions[0], Transaction)
+        self.assertEqual(transactions, expected)
+
+        parse_body_html(transactions)
+        parse_receipt_raw(transactions)
+        self.assertIsInstance(transactions[0]["receipt_data"]["items"][0], Item)
+        self.assertIsInstance(parallel[0], Transaction)
+        self.assertIsInstance(parallel[0]["receipt_data"]["items"][0], Item)
+
+    def test_mail_plain_text(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            mbox_file_path = os.path.join(tempdir, "plain.mbox")
+            with open(mbox_file_path, "wb") as file:
+                for time in ["15:23:14", "16:23:14"]:
+                    file.write(
+                        b"From someone@fake.it.com Sat Apr 26 "
+                        + time.encode()
+                        + b" 2025\nFrom: someone@fake.it.com\nDate: Sat, 26 Apr 2025 "
+                        + time.encode()
+                        + b" +0000\nContent-Type: text/plain\n\nnot a receipt\n\n"
+                    )
+            expected = parse_mbox_file(mbox_file_path)
+            mail.RECORDS = True
+            try:
+                transactions = parse_mbox_file(mbox_file_path)
+            finally:
+                mail.RECORDS = False
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(transactions, expected)
+        self.assertEqual(transactions[1]["body_text"], "not a receipt\n")
+        self.assertEqual(
+            Transaction.from_dict(json.loads(json.dumps(expected[1]))), expected[1]
+        )
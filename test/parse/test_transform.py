@@ -1,9 +1,14 @@
+import datetime
 import json
 import unittest
 from decimal import Decimal
 
+import numpy as np
+
 from app.parse.date import datetime_serializer
+from app.parse.receipt import CATEGORIES
 from app.parse.transform import (
+    UNKNOWN_CATEGORY,
     TransformFormat,
     _transform_receipt_parsed_to_list,
     _transform_receipt_parsed_to_table,
@@ -183,3 +188,73 @@ class TestParseTransform(unittest.TestCase):
             ],
             json.dumps(results, default=datetime_serializer, indent=2),
         )
+
+    def test_all_columnar(self):
+        results = transform_receipt_parsed(
+            self.receipt_parsed_sample, format=TransformFormat.Columnar
+        )
+        self.assertEqual(
+            sorted(results.keys()), ["category", "date", "price", "taxable", "trans"]
+        )
+        self.assertEqual(results["date"].dtype, np.dtype("datetime64[s]"))
+        self.assertEqual(results["category"].dtype, np.int16)
+        self.assertEqual(results["price"].dtype, np.int64)
+        self.assertEqual(results["taxable"].dtype, np.bool_)
+        self.assertEqual(results["trans"].dtype, np.int32)
+
+        expected = transform_receipt_parsed(
+            self.receipt_parsed_sample, format=TransformFormat.List
+        )
+        self.assertEqual(len(results["price"]), 35)
+        self.assertEqual(
+            [CATEGORIES[code] for code in results["category"]],
+            [row["category"] for row in expected],
+        )
+        self.assertEqual(
+            results["price"].tolist(),
+            [int(row["price"] * 100) for row in expected],
+        )
+        self.assertEqual(
+            results["date"].astype(datetime.datetime).tolist(),
+            [
+                datetime.datetime.fromisoformat(row["date"]).replace(tzinfo=None)
+                for row in expected
+            ],
+        )
+        self.assertEqual(results["trans"].tolist(), [0] * 4 + [1] * 31)
+        self.assertEqual(
+            results["taxable"].tolist(),
+            [
+                item["taxable"]
+                for trans in self.receipt_parsed_sample
+                for item in trans["receipt_data"]["items"]
+            ],
+        )
+
+    def test_columnar_missing(self):
+        transactions = [
+            {"id": "no receipt"},
+            {
+                "date_epoch": 0,
+                "receipt_data": {
+                    "items": [{"category": None, "price": 123}],
+                },
+            },
+            {
+                "receipt_data": {
+                    "items": [{"category": "DELI", "price": Decimal("1.50")}]
+                }
+            },
+        ]
+        results = transform_receipt_parsed(
+            transactions, format=TransformFormat.Columnar
+        )
+        self.assertEqual(results["trans"].tolist(), [1, 2])
+        self.assertEqual(
+            results["category"].tolist(),
+            [UNKNOWN_CATEGORY, CATEGORIES.index("DELI")],
+        )
+        self.assertEqual(results["price"].tolist(), [123, 150])
+        self.assertEqual(results["taxable"].tolist(), [False, False])
+        self.assertEqual(results["date"][0], np.datetime64(0, "s"))
+        self.assertTrue(np.isnat(results["date"][1]))
@@ -0,0 +1,99 @@
+import json
+import unittest
+
+from app.parse.date import datetime_serializer
+from app.parse.receipt import ReceiptParser, _parse_receipt_raw
+from app.parse.warning import ParseWarning, count_warnings
+
+
+class CountRepr:
+    def __init__(self):
+        self.count = 0
+
+    def __repr__(self):
+        self.count += 1
+        return "item"
+
+
+class TestParseWarning(unittest.TestCase):
+    def test_lazy(self):
+        item = CountRepr()
+        warning = ParseWarning(
+            "invalid_price", "invalid price? {line} -- {item!r}", item=item, line="x"
+        )
+        self.assertEqual(item.count, 0)
+        self.assertEqual(str(warning), "invalid price? x -- item")
+        self.assertEqual(item.count, 1)
+        self.assertEqual(warning, "invalid price? x -- item")
+        self.assertEqual(
+            json.dumps([warning], default=datetime_serializer),
+            '[{"code": "invalid_price", "message": "invalid price? x -- item"}]',
+        )
+
+    def test_dict_round_trip(self):
+        warning = ParseWarning(
+            "invalid_price",
+            "invalid price? {line} -- {item}",
+            item={"name": "x"},
+            line="y",
+        )
+        loaded = ParseWarning.from_dict(
+            json.loads(json.dumps(warning, default=datetime_serializer)), "a"
+        )
+        self.assertEqual(loaded.code, "invalid_price")
+        self.assertEqual(loaded.trans_id, "a")
+        self.assertEqual(str(loaded), "invalid price? y -- {'name': 'x'}")
+        self.assertEqual(loaded, warning)
+        self.assertEqual(count_warnings([{"warning": [loaded]}]), {"invalid_price": 1})
+
+    def test_receipt(self):
+        trans = {
+            "id": "a",
+            "receipt_raw": [
+                "Store #00                             ",
+                "PRODUCE                               ",
+                "        BANANAS                 1.26 F",
+                "        SAVINGS                 0.26-T",
+            ],
+        }
+        _parse_receipt_raw(trans)
+        warnings = trans["warning"]
+        self.assertEqual(
+            [warning.code for warning in warnings],
+            ["mismatch_taxable", "unfinished_groceries", "no_balance"],
+        )
+        self.assertEqual([warning.trans_id for warning in warnings], ["a", "a", "a"])
+        self.assertIs(warnings[0].item, trans["receipt_data"]["items"][0])
+        self.assertTrue(str(warnings[0]).startswith("mismatch taxable: ['SAVINGS'"))
+        self.assertEqual(
+            count_warnings([trans, trans, {"warning": ["missing date"]}]),
+            {
+                "mismatch_taxable": 2,
+                "unfinished_groceries": 2,
+                "no_balance": 2,
+                "other": 1,
+            },
+        )
+
+    def test_weight(self):
+        parser = ReceiptParser()
+        parser.feed(
+            [
+                "Store #00                             ",
+                "PRODUCE                               ",
+                " 1.5 lb @ 0.59 /lb = 0.90             ",
+                "        BANANAS                 1.00 F",
+                "        SAVINGS                 0.11-F",
+                "   PRICE YOU PAY           0.89       ",
+                " 2.13 lb @ 0.59 /lb = 1.26            ",
+                "WT      BANANAS                 1.26 F",
+            ]
+        )
+        self.assertEqual(
+            [warning.code for warning in parser.warning],
+            ["weight_verify_mismatch", "weight_item_mismatch", "weight_cost_on_item"],
+        )
+        self.assertEqual(
+            str(parser.warning[0]).split(" -- ")[0],
+            "verify price (PRICE YOU PAY) does not match weight cost: 1.5 lb @ 0.59 /lb, 0.90",
+        )
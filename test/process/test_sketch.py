@@ -0,0 +1,166 @@
+import bisect
+import json
+import random
+import unittest
+from decimal import Decimal
+
+from app.process.sketch import KllSketch, SpaceSaving, TopItems, sketch_graph_top
+
+
+class TestSpaceSaving(unittest.TestCase):
+    def test_exact(self):
+        sketch = SpaceSaving(capacity=10)
+        for key, weight in [("a", 3), ("b", 1), ("a", 2), ("c", 4)]:
+            sketch.add(key, weight)
+        self.assertEqual(sketch.top(), [("a", 5, 0), ("c", 4, 0), ("b", 1, 0)])
+        self.assertEqual(sketch.top(1), [("a", 5, 0)])
+        self.assertEqual(sketch.total, 10)
+
+    def test_replace_smallest(self):
+        sketch = SpaceSaving(capacity=2)
+        for key, weight in [("a", 5), ("b", 1), ("c", 2)]:
+            sketch.add(key, weight)
+        # c takes over b's count
+        self.assertEqual(sketch.top(), [("a", 5, 0), ("c", 3, 1)])
+
+    def test_bounds(self):
+        random.seed(0)
+        capacity = 50
+        sketch = SpaceSaving(capacity)
+        exact = {}
+        for _ in range(20000):
+            key = f"item {int(random.paretovariate(1.2))}"
+            weight = random.randint(1, 500)
+            sketch.add(key, weight)
+            exact[key] = exact.get(key, 0) + weight
+
+        self.assertGreater(len(exact), capacity)
+        self.assertEqual(len(sketch.counts), capacity)
+        self.assertEqual(sketch.total, sum(exact.values()))
+        for key, count, error in sketch.top(capacity):
+            self.assertLessEqual(count - error, exact[key], key)
+            self.assertLessEqual(exact[key], count, key)
+        for key, total in exact.items():
+            if total > sketch.total / capacity:
+                self.assertIn(key, sketch.counts)
+        expected = sorted(exact, key=exact.get, reverse=True)[:3]
+        self.assertEqual([key for key, _, _ in sketch.top(3)], expected)
+
+    def test_weight(self):
+        sketch = SpaceSaving()
+        with self.assertRaises(ValueError):
+            sketch.add("a", 0)
+        with self.assertRaises(ValueError):
+            sketch.add("a", -1)
+
+
+class TestTopItems(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        with open(
+            "data/test_data/receipt_parsed_sample.json", "r", encoding="utf-8"
+        ) as file:
+            self.receipt_parsed_sample = json.loads(file.read())
+            for trans in self.receipt_parsed_sample:
+                for item in trans["receipt_data"]["items"]:
+                    item["price"] = Decimal(item["price"])
+
+    def test_top_items(self):
+        top = TopItems().add(self.receipt_parsed_sample)
+        self.assertEqual(top.count.total, 35)
+        self.assertEqual(
+            top.spend.top(3),
+            [
+                ("STMPTWN FOUNDERS", 1399, 0),
+                ("PRE BEEF RE STK", 1199, 0),
+                ("PB MNST CK 12CT", 1038, 0),
+            ],
+        )
+        self.assertEqual(
+            top.count.top(2), [("PB MNST CK 12CT", 2, 0), ("BP HD MT FRANKS", 2, 0)]
+        )
+
+    def test_skip_free(self):
+        transactions = [
+            {"id": "no receipt"},
+            {
+                "receipt_data": {
+                    "items": [
+                        {"name": "FREE", "price": 0},
+                        {"name": "REFUND", "price": Decimal("-1.00")},
+                        {"name": "MILK", "price": Decimal("3.00")},
+                    ]
+                }
+            },
+        ]
+        top = TopItems().add(transactions)
+        self.assertEqual(top.spend.top(), [("MILK", 300, 0)])
+        self.assertEqual(top.count.total, 3)
+
+    def test_graph(self):
+        top = TopItems(capacity=3).add(self.receipt_parsed_sample)
+        self.assertEqual(
+            sketch_graph_top(top.spend, 3, money=True, width=10),
+            """
+ ██████████  47.20 ±45.75 · FRESH BANANAS
+ ▐█████████  46.37 ±44.88 · BROCCOLI CROWNS
+ ▐█████████  46.23 ±40.13 · RED SEEDLESS GRA
+""",
+        )
+        self.assertEqual(
+            sketch_graph_top(top.count, 2, width=4),
+            """
+ ████  12 ±11 · BROCCOLI CROWNS
+ ████  12 ±11 · FRESH BANANAS
+""",
+        )
+        self.assertEqual(sketch_graph_top(TopItems().spend), "\n")
+
+
+class TestKllSketch(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        random.seed(0)
+        self.values = [int(random.lognormvariate(6, 1)) for _ in range(50000)]
+        self.sorted = sorted(self.values)
+
+    def rank(self, value):
+        return bisect.bisect_left(self.sorted, value) / len(self.sorted)
+
+    def test_exact(self):
+        sketch = KllSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        for value in [5, 1, 4, 2, 3]:
+            sketch.add(value)
+        self.assertEqual(sketch.quantiles([0, 0.2, 0.5, 0.9, 1]), [1, 1, 3, 5, 5])
+
+    def test_quantiles(self):
+        sketch = KllSketch()
+        for value in self.values:
+            sketch.add(value)
+        self.assertEqual(sketch.n, len(self.values))
+        self.assertLess(sum(map(len, sketch.compactors)), 1000)
+        self.assertEqual(sum(weight for _, weight in sketch._weighted()), sketch.n)
+        for q in [0.01, 0.25, 0.5, 0.95, 0.99]:
+            self.assertAlmostEqual(self.rank(sketch.quantile(q)), q, delta=0.02)
+
+        # same seed, same sketch
+        again = KllSketch()
+        for value in self.values:
+            again.add(value)
+        self.assertEqual(again.compactors, sketch.compactors)
+
+    def test_merge(self):
+        parts = [KllSketch(seed=seed) for seed in range(3)]
+        for index, value in enumerate(self.values):
+            parts[index % 3].add(value)
+        merged = parts[0].merge(parts[1]).merge(parts[2])
+        self.assertEqual(merged.n, len(self.values))
+        self.assertEqual(sum(weight for _, weight in merged._weighted()), merged.n)
+        for q in [0.5, 0.95]:
+            self.assertAlmostEqual(self.rank(merged.quantile(q)), q, delta=0.02)
+        # the parts are left alone
+        self.assertEqual(sum(part.n for part in parts), merged.n)
+
+        with self.assertRaises(ValueError):
+            KllSketch(k=100).merge(KllSketch(k=200))
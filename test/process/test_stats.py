@@ -1,12 +1,31 @@
 import datetime
 import json
+import os
+import pickle
+import random
+import tempfile
 import unittest
 from decimal import Decimal
 
 import dateutil.parser
 
 from app.parse.date import datetime_serializer
-from app.process.stats import stats_graph_agg, stats_sum_receipt_parsed
+from app.parse.money import to_cents
+from app.parse.transform import TransformFormat, transform_receipt_parsed
+from app.parse.warning import ParseWarning
+from app.process.stats import (
+    Aggregate,
+    DateRangeIndex,
+    RollupCube,
+    stats_graph_agg,
+    stats_merge_price_quantiles,
+    stats_price_quantiles,
+    stats_quantile_agg,
+    stats_rolling_sums,
+    stats_sum_columnar,
+    stats_sum_date_range,
+    stats_sum_receipt_parsed,
+)
 
 
 class TestSumTransactions(unittest.TestCase):
@@ -80,9 +99,246 @@ class TestSumTransactions(unittest.TestCase):
             json.dumps(agg, default=datetime_serializer, indent=2),
         )
 
-    @unittest.skip("not implemented yet")
+    def test_sum_cats_cents(self):
+        transactions = [
+            {
+                **trans,
+                "receipt_data": {
+                    "items": [
+                        {**item, "price": to_cents(item["price"])}
+                        for item in trans["receipt_data"]["items"]
+                    ]
+                },
+            }
+            for trans in self.receipt_parsed_sample
+        ]
+        agg = stats_sum_receipt_parsed(transactions, cents=True)
+        self.assertEqual(agg, self.agg)
+        self.assertEqual(str(agg["cats"]["PRODUCE"]), "42.92")
+
+    def test_sum_cats_columnar(self):
+        columns = transform_receipt_parsed(
+            self.receipt_parsed_sample, format=TransformFormat.Columnar
+        )
+        agg = stats_sum_columnar(columns, self.receipt_parsed_sample)
+        self.assertEqual(agg, self.agg)
+        self.assertIs(agg["date_min"], self.receipt_parsed_sample[1]["date"])
+        self.assertIs(agg["date_max"], self.receipt_parsed_sample[0]["date"])
+        self.assertEqual(stats_graph_agg(agg), stats_graph_agg(self.agg))
+
+        # UTC dates, without the transactions
+        self.assertEqual(stats_sum_columnar(columns), self.agg)
+
+        empty = stats_sum_columnar(
+            transform_receipt_parsed([], format=TransformFormat.Columnar)
+        )
+        self.assertIsNone(empty["date_min"])
+        self.assertIsNone(empty["date_max"])
+        self.assertNotIn(None, empty["cats"])
+
+    def test_sum_cats_columnar_unknown(self):
+        transactions = [
+            {
+                "date": self.agg["date_min"],
+                "receipt_data": {
+                    "items": [
+                        {"category": "DELI", "price": Decimal("1.25")},
+                        {"category": None, "price": Decimal("2.50")},
+                        {"category": None, "price": Decimal("0.25")},
+                    ]
+                },
+            },
+        ]
+        columns = transform_receipt_parsed(
+            transactions, format=TransformFormat.Columnar
+        )
+        self.assertEqual(
+            stats_sum_columnar(columns, transactions),
+            stats_sum_receipt_parsed(transactions),
+        )
+
     def test_sum_cats_with_date_range(self):
-        pass
+        columns = transform_receipt_parsed(
+            self.receipt_parsed_sample, format=TransformFormat.Columnar
+        )
+        index = DateRangeIndex(columns, self.receipt_parsed_sample)
+        date_min = self.agg["date_min"]
+        date_max = self.agg["date_max"]
+
+        self.assertEqual(stats_sum_date_range(index), self.agg)
+        self.assertEqual(
+            stats_sum_date_range(index, date_min, date_max + datetime.timedelta(1)),
+            self.agg,
+        )
+
+        # [start, end)
+        for start, end, transactions in [
+            (date_min, date_max, self.receipt_parsed_sample[1:]),
+            (date_max, None, self.receipt_parsed_sample[:1]),
+            (None, datetime.date(2025, 6, 1), self.receipt_parsed_sample[1:]),
+            (datetime.date(2025, 6, 1), None, self.receipt_parsed_sample[:1]),
+            (int(date_min.timestamp()) + 1, date_max, []),
+            (date_max, date_min, []),
+        ]:
+            agg = stats_sum_date_range(index, start, end)
+            self.assertEqual(agg, stats_sum_receipt_parsed(transactions), (start, end))
+
+        self.assertEqual(
+            stats_graph_agg(stats_sum_date_range(index, None, date_max)),
+            """
+ ██████  42.92 · PRODUCE
+  █████  22.75 · DAIRY
+  █████  20.55 · GROCERY
+  █████  16.99 · MEAT
+    ███   7.73 · GENERAL MERCHANDISE
+""",
+        )
+
+        # UTC dates, without the transactions
+        agg = stats_sum_date_range(DateRangeIndex(columns), date_max)
+        self.assertEqual(agg["date_min"], date_max)
+        self.assertEqual(agg["date_min"].tzinfo, datetime.timezone.utc)
+
+    def test_aggregate(self):
+        agg = Aggregate(self.receipt_parsed_sample)
+        self.assertEqual(agg.to_agg(), self.agg)
+        self.assertEqual(agg.counts["DAIRY"], 8)
+        self.assertEqual(sum(agg.counts.values()), 35)
+        self.assertEqual(agg.warnings, {})
+        self.assertEqual(stats_graph_agg(agg.to_agg()), stats_graph_agg(self.agg))
+        self.assertEqual(pickle.loads(pickle.dumps(agg)), agg)
+
+    def test_aggregate_merge(self):
+        first, second = self.receipt_parsed_sample
+        warnings = [
+            {"id": "no receipt", "warning": ["missing date"]},
+            {"id": "also no receipt", "warning": [ParseWarning("no_balance", "")]},
+        ]
+        parts = [
+            Aggregate([first]),
+            Aggregate([second, warnings[0]]),
+            Aggregate(warnings[1:]),
+        ]
+        expected = Aggregate([first, second, *warnings])
+        self.assertEqual(expected.warnings, {"other": 1, "no_balance": 1})
+        self.assertEqual(expected.to_agg(), self.agg)
+
+        # any grouping, any order
+        self.assertEqual(parts[0].merge(parts[1]).merge(parts[2]), expected)
+        self.assertEqual(parts[0].merge(parts[1].merge(parts[2])), expected)
+        self.assertEqual(parts[2].merge(parts[1]).merge(parts[0]), expected)
+        # nothing
+        self.assertEqual(Aggregate().merge(expected), expected)
+        self.assertEqual(expected.merge(Aggregate()), expected)
+        self.assertIsNone(Aggregate().to_agg()["date_min"])
+
+    def test_price_quantiles(self):
+        sketches = stats_price_quantiles(self.receipt_parsed_sample)
+        self.assertEqual(sketches["DAIRY"].n, 8)
+        # small enough to be exact
+        dairy = sorted(
+            to_cents(item["price"])
+            for trans in self.receipt_parsed_sample
+            for item in trans["receipt_data"]["items"]
+            if item["category"] == "DAIRY"
+        )
+        self.assertEqual(sketches["DAIRY"].quantile(0.5), dairy[3])
+        self.assertEqual(sketches["DAIRY"].quantile(1), dairy[-1])
+
+        agg = stats_quantile_agg(sketches, 0.5)
+        self.assertEqual(agg["cats"]["DAIRY"], Decimal(dairy[3]).scaleb(-2))
+        self.assertEqual(agg["cats"]["DELI"], 0)
+        self.assertIn("DAIRY", stats_graph_agg(agg))
+
+        first, second = (
+            stats_price_quantiles([trans]) for trans in self.receipt_parsed_sample
+        )
+        merged = stats_merge_price_quantiles(first, second)
+        self.assertEqual(sorted(merged), sorted(sketches))
+        for category, sketch in sketches.items():
+            self.assertEqual(
+                merged[category].quantiles([0.5, 0.95]), sketch.quantiles([0.5, 0.95])
+            )
+        # first and second are left alone
+        self.assertEqual(first["DAIRY"].n + second["DAIRY"].n, 8)
+        stats_price_quantiles(self.receipt_parsed_sample, merged)
+        self.assertEqual(merged["DAIRY"].n, 16)
+        self.assertEqual(first["DAIRY"].n + second["DAIRY"].n, 8)
+
+    def test_rolling_sums(self):
+        series = stats_rolling_sums(
+            self.receipt_parsed_sample, datetime.timedelta(days=7)
+        )
+        first, last = self.agg["date_min"], self.agg["date_max"]
+        # one point a day, from the first transaction until past the last one
+        self.assertEqual(len(series["dates"]), 25)
+        self.assertEqual(series["dates"][0], first)
+        self.assertEqual(series["dates"][-1], first + datetime.timedelta(days=24))
+        self.assertGreaterEqual(series["dates"][-1], last)
+        self.assertEqual(sorted(series["cats"]), sorted(self.agg["cats"]))
+
+        produce = series["cats"]["PRODUCE"]
+        self.assertEqual(produce[:7], [Decimal("42.92")] * 7)
+        self.assertEqual(produce[7:], [0] * 18)
+        dairy = series["cats"]["DAIRY"]
+        self.assertEqual(dairy[:7], [Decimal("22.75")] * 7)
+        self.assertEqual(dairy[7:24], [0] * 17)
+        self.assertEqual(dairy[24], Decimal("10.38"))
+
+        # wide enough for everything
+        series = stats_rolling_sums(
+            self.receipt_parsed_sample,
+            datetime.timedelta(days=90),
+            step=datetime.timedelta(days=30),
+        )
+        self.assertEqual(len(series["dates"]), 2)
+        self.assertEqual(
+            {category: sums[-1] for category, sums in series["cats"].items()},
+            self.agg["cats"],
+        )
+
+        self.assertEqual(
+            stats_rolling_sums([], datetime.timedelta(days=7))["dates"], []
+        )
+        for step in [datetime.timedelta(0), datetime.timedelta(days=-1)]:
+            with self.assertRaises(ValueError):
+                stats_rolling_sums(
+                    self.receipt_parsed_sample, datetime.timedelta(days=7), step
+                )
+
+    def test_rolling_sums_brute_force(self):
+        random.seed(0)
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        transactions = [
+            {
+                "date": start + datetime.timedelta(hours=random.randrange(24 * 120)),
+                "receipt_data": {
+                    "items": [
+                        {
+                            "category": random.choice(["DAIRY", "MEAT", "PRODUCE"]),
+                            "price": random.randrange(1, 2000),
+                        }
+                        for _ in range(random.randrange(5))
+                    ]
+                },
+            }
+            for _ in range(200)
+        ]
+        window = datetime.timedelta(days=30)
+        series = stats_rolling_sums(
+            transactions, window, step=datetime.timedelta(hours=12)
+        )
+        for index, point in enumerate(series["dates"][::17]):
+            expected = stats_sum_receipt_parsed(
+                [
+                    trans
+                    for trans in transactions
+                    if point - window < trans["date"] <= point
+                ],
+                cents=True,
+            )
+            for category, sum in expected["cats"].items():
+                self.assertEqual(series["cats"][category][index * 17], sum, point)
 
     def test_graph_it(self):
         self.assertEqual(
@@ -108,3 +364,148 @@ class TestSumTransactions(unittest.TestCase):
     ▐██   4.49 · BAKERY - COMMERCIAL
 """,
         )
+
+
+class TestRollupCube(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        with open(
+            "data/test_data/receipt_parsed_sample.json", "r", encoding="utf-8"
+        ) as file:
+            self.receipt_parsed_sample = json.loads(file.read())
+            for trans in self.receipt_parsed_sample:
+                trans["date"] = dateutil.parser.isoparse(trans["date"])
+                for item in trans["receipt_data"]["items"]:
+                    item["price"] = Decimal(item["price"])
+
+    def test_rollup(self):
+        cube = RollupCube()
+        self.assertEqual(cube.add(self.receipt_parsed_sample), 2)
+        self.assertEqual(sorted(cube.days), ["2025-05-24", "2025-06-16"])
+        self.assertEqual(cube.days["2025-06-16"]["DAIRY"], [1038, 2])
+
+        self.assertEqual(list(cube.rollup("week")), ["2025-W21", "2025-W25"])
+        months = cube.rollup("month")
+        self.assertEqual(list(months), ["2025-05", "2025-06"])
+        self.assertEqual(months["2025-05"]["DAIRY"], [2275, 6])
+
+        # same as summing the transactions in that month
+        agg = cube.agg("month", "2025-06")
+        expected = stats_sum_receipt_parsed(self.receipt_parsed_sample[:1])
+        self.assertEqual(agg["cats"], expected["cats"])
+        self.assertEqual(agg["date_min"], datetime.date(2025, 6, 16))
+        self.assertEqual(agg["date_max"], datetime.date(2025, 6, 16))
+        self.assertEqual(stats_graph_agg(agg), stats_graph_agg(expected))
+
+        total = {}
+        for cells in cube.rollup("month").values():
+            for category, (cents, _) in cells.items():
+                total[category] = total.get(category, 0) + cents
+        self.assertEqual(
+            {category: Decimal(cents).scaleb(-2) for category, cents in total.items()},
+            {
+                category: sum
+                for category, sum in stats_sum_receipt_parsed(
+                    self.receipt_parsed_sample
+                )["cats"].items()
+                if sum
+            },
+        )
+
+        empty = cube.agg("week", "2024-W01")
+        self.assertIsNone(empty["date_min"])
+        self.assertEqual(set(empty["cats"].values()), {0})
+
+    def test_incremental(self):
+        cube = RollupCube()
+        self.assertEqual(cube.add(self.receipt_parsed_sample[:1]), 1)
+        self.assertEqual(cube.add(self.receipt_parsed_sample), 1)
+        self.assertEqual(cube.add(self.receipt_parsed_sample), 0)
+        self.assertEqual(cube.add([{"id": "no receipt"}]), 0)
+
+        expected = RollupCube()
+        expected.add(self.receipt_parsed_sample)
+        self.assertEqual(cube.days, expected.days)
+
+    def test_same_email_in_another_file(self):
+        copy = {**self.receipt_parsed_sample[0], "id": "0@another.mbox"}
+        cube = RollupCube()
+        self.assertEqual(cube.add(self.receipt_parsed_sample), 2)
+        self.assertEqual(cube.add([copy]), 0)
+        self.assertEqual(cube.sync(self.receipt_parsed_sample + [copy]), 0)
+
+        expected = RollupCube()
+        expected.add(self.receipt_parsed_sample)
+        self.assertEqual(cube.days, expected.days)
+
+    def test_sync(self):
+        cube = RollupCube()
+        self.assertEqual(cube.sync(self.receipt_parsed_sample[:1]), 1)
+        self.assertEqual(cube.sync(self.receipt_parsed_sample), 1)
+        self.assertEqual(cube.sync(self.receipt_parsed_sample), 0)
+
+        # the file with the first one was removed
+        self.assertEqual(cube.sync(self.receipt_parsed_sample[1:]), 0)
+        expected = RollupCube()
+        expected.add(self.receipt_parsed_sample[1:])
+        self.assertEqual(cube.days, expected.days)
+        self.assertEqual(cube.seen, expected.seen)
+
+        # parsed again, and it's on another day now
+        moved = {
+            **self.receipt_parsed_sample[1],
+            "date": self.receipt_parsed_sample[0]["date"],
+        }
+        self.assertEqual(cube.sync([moved]), 0)
+        self.assertEqual(sorted(cube.days), ["2025-06-16"])
+        self.assertEqual(cube.days["2025-06-16"], expected.days["2025-05-24"])
+
+    def test_sync_changed_receipt(self):
+        trans = {
+            "date_raw": "Sat, 26 Apr 2025 15:23:14 +0000",
+            "date": datetime.datetime(2025, 4, 26, 15, 23, 14),
+            "receipt_data": {"items": [{"category": "DELI", "price": Decimal("1.00")}]},
+        }
+        cube = RollupCube()
+        self.assertEqual(cube.sync([trans]), 1)
+        self.assertEqual(cube.days["2025-04-26"]["DELI"], [100, 1])
+
+        # parsed again (same email), and the receipt came out different
+        changed = {
+            **trans,
+            "receipt_data": {"items": [{"category": "DELI", "price": Decimal("2.00")}]},
+        }
+        self.assertEqual(cube.sync([changed]), 0)
+        self.assertEqual(cube.days["2025-04-26"]["DELI"], [200, 1])
+        self.assertEqual(cube.sync([changed]), 0)
+        self.assertEqual(cube.days["2025-04-26"]["DELI"], [200, 1])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "rollup.json")
+            cube = RollupCube.load(filepath)
+            self.assertEqual(cube.days, {})
+            cube.add(self.receipt_parsed_sample[:1])
+            cube.save(filepath)
+
+            cube = RollupCube.load(filepath)
+            self.assertEqual(
+                list(cube.seen), [self.receipt_parsed_sample[0]["date_raw"]]
+            )
+            self.assertEqual(
+                cube.seen[self.receipt_parsed_sample[0]["date_raw"]][0], "2025-06-16"
+            )
+            self.assertEqual(cube.add(self.receipt_parsed_sample), 1)
+
+            expected = RollupCube()
+            expected.add(self.receipt_parsed_sample)
+            self.assertEqual(cube.days, expected.days)
+            self.assertEqual(os.listdir(directory), ["rollup.json"])
+
+            # saved by trans id
+            with open(filepath, "w") as file:
+                file.write(json.dumps({"days": expected.days, "seen": ["a"]}))
+            cube = RollupCube.load(filepath)
+            self.assertEqual(cube.days, {})
+            self.assertEqual(cube.sync(self.receipt_parsed_sample), 2)
+            self.assertEqual(cube.days, expected.days)